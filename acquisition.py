@@ -0,0 +1,183 @@
+import threading
+import time
+import numpy as np
+from hal import RealClock
+from latency import StageTimer
+
+# Sample layout: timestamp (s, monotonic) + raw accel/gyro counts
+SAMPLE_COLS = 7
+T, AX, AY, AZ, GX, GY, GZ = range(SAMPLE_COLS)
+
+# When paced to the sensor rate, wake this fraction of a period after the last
+# sample so the next one is just about ready
+PACE_FRACTION = 0.9
+
+
+# Fixed-size ring buffer of raw samples, single writer / single reader
+class RingBuffer:
+    def __init__(self, capacity=8192):
+        self.capacity = capacity
+        self.data = np.zeros((capacity, SAMPLE_COLS))
+        self.lock = threading.Lock()
+        self.head = 0       # total samples written
+        self.tail = 0       # total samples consumed
+        self.overruns = 0   # samples dropped because the reader fell behind
+
+    def write(self, t, ax, ay, az, gx, gy, gz):
+        with self.lock:
+            if self.head - self.tail >= self.capacity:
+                # drop the oldest unread sample rather than blocking the sensor
+                self.tail += 1
+                self.overruns += 1
+            row = self.data[self.head % self.capacity]
+            row[T] = t
+            row[AX] = ax
+            row[AY] = ay
+            row[AZ] = az
+            row[GX] = gx
+            row[GY] = gy
+            row[GZ] = gz
+            self.head += 1
+
+    # Write n samples at once: t is (n,), raw is (n, 6)
+    def write_block(self, t, raw):
+        dropped = max(0, len(t) - self.capacity)
+        if dropped:
+            t = t[dropped:]
+            raw = raw[dropped:]
+        n = len(t)
+        with self.lock:
+            self.overruns += dropped
+            free = self.capacity - (self.head - self.tail)
+            if n > free:
+                self.tail += n - free
+                self.overruns += n - free
+            idx = np.arange(self.head, self.head + n) % self.capacity
+            self.data[idx, T] = t
+            self.data[idx, AX:] = raw
+            self.head += n
+
+    # Copy out every unread sample (oldest first) as an (n, SAMPLE_COLS) array
+    def read(self):
+        with self.lock:
+            n = self.head - self.tail
+            start = self.tail % self.capacity
+            if start + n <= self.capacity:
+                out = self.data[start:start + n].copy()
+            else:
+                out = np.concatenate((self.data[start:], self.data[:start + n - self.capacity]))
+            self.tail = self.head
+        return out
+
+    def clear(self):
+        with self.lock:
+            self.tail = self.head
+            self.overruns = 0
+
+    def __len__(self):
+        with self.lock:
+            return self.head - self.tail
+
+
+# Background thread that only reads the IMU and pushes raw samples. With a
+# rate (the sensor's configured output data rate, see SensorConfig) it sleeps
+# for most of a sample period after each read instead of polling dataReady.
+class AcquisitionThread(threading.Thread):
+    def __init__(self, imu, buffer, poll_interval=0.001, clock=None, rate=None):
+        super().__init__(daemon=True)
+        self.imu = imu
+        self.buffer = buffer
+        self.poll_interval = poll_interval
+        self.clock = clock or RealClock()
+        self.period = 1.0 / rate if rate else None
+        self.recording = threading.Event()
+        self.stopped = threading.Event()
+        self.busy = threading.Lock()
+        #per-stage latency: dataReady poll, getAgmt I2C read, buffer write,
+        #idle sleep, and the gap between consecutive samples
+        self.timing = StageTimer("poll", "read", "write", "sleep", "gap")
+        self.samples = 0
+        self.first_t = None
+        self.last_t = None
+        self.max_gap = 0.0
+
+    def run(self):
+        sleep = self.timing["sleep"]
+        clock = self.clock
+        perf = time.perf_counter
+        while not self.stopped.is_set():
+            if not self.recording.wait(0.05):
+                continue
+            if self.poll_once():
+                if self.period is None:
+                    continue
+                #a stall past the next sample leaves nothing to wait for
+                delay = max(0.0, self.last_t + self.period * PACE_FRACTION - clock.now())
+            else:
+                delay = self.poll_interval
+            start = perf()
+            clock.sleep(delay)
+            sleep.add(perf() - start)
+
+    # One poll of the sensor; returns True if a sample was stored. Simulated
+    # runs call this directly instead of starting the thread.
+    def poll_once(self):
+        imu = self.imu
+        timing = self.timing
+        perf = time.perf_counter
+        with self.busy:
+            if not self.recording.is_set():
+                return False
+            t0 = perf()
+            ready = imu.dataReady()
+            t1 = perf()
+            timing["poll"].add(t1 - t0)
+            if not ready:
+                return False
+            imu.getAgmt()
+            t2 = perf()
+            timing["read"].add(t2 - t1)
+            now = self.clock.now()
+            self.buffer.write(now, imu.axRaw, imu.ayRaw, imu.azRaw,
+                              imu.gxRaw, imu.gyRaw, imu.gzRaw)
+            if self.last_t is None:
+                self.first_t = now
+            else:
+                gap = now - self.last_t
+                timing["gap"].add(gap)
+                if gap > self.max_gap:
+                    self.max_gap = gap
+            self.last_t = now
+            self.samples += 1
+            timing["write"].add(perf() - t2)
+            return True
+
+    def start_recording(self):
+        self.buffer.clear()
+        self.timing.reset()
+        self.samples = 0
+        self.first_t = None
+        self.last_t = None
+        self.max_gap = 0.0
+        self.recording.set()
+
+    # Returns once the thread has finished any read in progress, so a final
+    # buffer.read() sees every sample of the session
+    def stop_recording(self):
+        self.recording.clear()
+        with self.busy:
+            pass
+
+    def stop(self):
+        self.stop_recording()
+        self.stopped.set()
+        self.join(timeout=1.0)
+
+    def stats(self):
+        span = self.last_t - self.first_t if self.samples > 1 else 0.0
+        return {
+            "samples": self.samples,
+            "overruns": self.buffer.overruns,
+            "max_gap": self.max_gap,
+            "rate": (self.samples - 1) / span if span > 0 else 0.0,
+        }
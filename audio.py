@@ -0,0 +1,63 @@
+import os
+import time
+
+MUSIC = "si_music.mp3"
+
+# Spin music plus one clip per dimension
+CLIPS = [
+    MUSIC,
+    "Environmental.mp3",
+    "Emotional.mp3",
+    "Physical.mp3",
+    "Financial.mp3",
+    "Spiritual.mp3",
+    "Intellectual.mp3",
+    "Social.mp3",
+    "Occupational.mp3",
+]
+
+
+# Mixer is started once and every clip is decoded into memory up front, so a
+# spin only pays for Sound.play(), which returns immediately.
+# mixer is pygame.mixer or a stand-in with the same API (hal.SimMixer).
+class AudioEngine:
+    def __init__(self, mixer=None, clips=CLIPS, directory=".", buffer=512):
+        if mixer is None:
+            import pygame
+            mixer = pygame.mixer
+        self.mixer = mixer
+        mixer.pre_init(frequency=44100, size=-16, channels=2, buffer=buffer)
+        mixer.init()
+        self.sounds = {}
+        self.load_times = {}
+        for name in clips:
+            start = time.perf_counter()
+            self.sounds[name] = mixer.Sound(os.path.join(directory, name))
+            self.load_times[name] = time.perf_counter() - start
+        self.play_latency = []
+
+    # Stop whatever is playing and start a clip without blocking: by name, or
+    # a preloaded Sound from self.sounds (as MotionPlan.sound holds it)
+    def play(self, clip):
+        start = time.perf_counter()
+        sound = self.sounds[clip] if isinstance(clip, str) else clip
+        self.mixer.stop()
+        channel = sound.play()
+        self.play_latency.append(time.perf_counter() - start)
+        return channel
+
+    def stop(self):
+        self.mixer.stop()
+
+    def stats(self):
+        latency = self.play_latency
+        return {
+            "load_total": sum(self.load_times.values()),
+            "load_max": max(self.load_times.values()) if self.load_times else 0.0,
+            "plays": len(latency),
+            "play_mean": sum(latency) / len(latency) if latency else 0.0,
+            "play_max": max(latency) if latency else 0.0,
+        }
+
+    def quit(self):
+        self.mixer.quit()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# Micro-benchmarks for the per-sample and per-session hot paths, on simulated
+# hardware and synthetic data. Save a baseline with --save and compare a later
+# run against it with --compare.
+import argparse
+import asyncio
+import json
+import platform
+import time
+import numpy as np
+
+from hal import SimClock, SimGPIO, synthetic_trace
+from fusion import (raw_acc_to_ms2, raw_gyro_to_rads, gravity_from_quaternion, madgwick_step,
+                    madgwick_batch, complementary_batch, FusionKernel, LSB_PER_G, LSB_PER_RPS, MADGWICK_GAIN,
+                    convergence_samples)
+from motion import MotionStats, motion_averages, motion_features, wheel_frame
+from stepper import StepScheduler, FSCW, compile_waveform, plan_move, constant_times
+from simulate import build_wheel, run_session
+
+RATE = 100.0
+HOLDS = {"5s": 5.0, "30s": 30.0, "5min": 300.0}
+PINS = [23, 22, 17, 27]
+
+
+# Best-of-`repeat` seconds per call of fn(), each repeat timing `number` calls
+def timeit(fn, number=1000, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+# determine_motion() as main.py ran it before MotionStats, for comparison
+def determine_motion_lists(x_data, y_data, z_data, x_rot_data, y_rot_data, z_rot_data):
+    y_neg_data = [y for y in y_data if y < 0]
+    y_pos_data = [y for y in y_data if y > 0]
+    z_pos_data = [z for z in z_data if z > 0]
+    z_neg_data = [z for z in z_data if z < 0]
+    x_avg = sum(abs(x) for x in x_data) / len(x_data)
+    y_neg_avg = sum(abs(y) for y in y_neg_data) / len(y_neg_data) if y_neg_data else 0
+    y_pos_avg = sum(abs(y) for y in y_pos_data) / len(y_pos_data) if y_pos_data else 0
+    z_neg_avg = sum(abs(z) for z in z_neg_data) / len(z_neg_data) if z_neg_data else 0
+    z_pos_avg = sum(abs(z) for z in z_pos_data) / len(z_pos_data) if z_pos_data else 0
+    xr_avg = sum(abs(xr) for xr in x_rot_data) / len(x_rot_data)
+    yr_avg = sum(abs(yr) for yr in y_rot_data) / len(y_rot_data)
+    zr_avg = sum(abs(zr) for zr in z_rot_data) / len(z_rot_data)
+    averages = [x_avg, y_neg_avg, y_pos_avg, z_neg_avg, z_pos_avg, xr_avg, yr_avg, zr_avg]
+    return averages.index(max(averages))
+
+
+def per_call():
+    results = {}
+    q = np.array([0.99, 0.05, -0.08, 0.02])
+    q /= np.linalg.norm(q)
+    qt = tuple(q.tolist())
+
+    results["raw_acc_to_ms2"] = timeit(lambda: raw_acc_to_ms2(1200, -3400, 15800), 20000)
+    results["raw_gyro_to_rads"] = timeit(lambda: raw_gyro_to_rads(250, -80, 1900), 20000)
+    results["gravity_from_quaternion"] = timeit(lambda: gravity_from_quaternion(q), 20000)
+    results["madgwick_step"] = timeit(
+        lambda: madgwick_step(*qt, 0.1, -0.2, 0.3, 0.07, -0.2, 0.96, 0.01, MADGWICK_GAIN), 20000)
+    kernel = FusionKernel()
+    results["FusionKernel.update"] = timeit(
+        lambda: kernel.update(1200, -3400, 15800, 250, -80, 1900, 0.01), 20000)
+    try:
+        from ahrs.filters import Madgwick
+    except ImportError:
+        pass
+    else:
+        madgwick = Madgwick()
+        gyr = np.array([0.1, -0.2, 0.3])
+        acc = np.array([0.07, -0.2, 0.96])
+        results["ahrs Madgwick.updateIMU"] = timeit(lambda: madgwick.updateIMU(q.copy(), gyr, acc), 5000)
+    stats = MotionStats()
+    results["MotionStats.update"] = timeit(lambda: stats.update(0.3, -1.2, 0.8, 0.02, -0.4, 0.1), 20000)
+
+    # one step of spin(): deadline wait + one multi-pin write, on the simulated clock
+    steps = 2000
+    scheduler = StepScheduler(SimGPIO(), PINS, SimClock())
+    waveform = compile_waveform(FSCW, steps)
+    times = constant_times(steps, 0.006)
+    results["spin step"] = timeit(lambda: scheduler.run(waveform, times), 1, 5) / steps
+    results["plan_move (400 steps)"] = timeit(lambda: plan_move(400, 0.8), 200)
+    return results
+
+
+def per_session():
+    results = {}
+    for label, hold in HOLDS.items():
+        n = int(hold * RATE)
+        raw = synthetic_trace(n, RATE)
+        rows = raw.tolist()
+        dt = 1.0 / RATE
+
+        def kernel_loop():
+            kernel = FusionKernel()
+            for row in rows:
+                kernel.update(row[0], row[1], row[2], row[3], row[4], row[5], dt)
+        results["fusion kernel %s" % label] = timeit(kernel_loop, 1, 3)
+        results["madgwick_batch %s" % label] = timeit(lambda: madgwick_batch(raw, dt), 1, 3)
+        results["complementary_batch %s" % label] = timeit(lambda: complementary_batch(raw, dt), 1, 3)
+
+        _, lin = madgwick_batch(raw, dt)
+        gyr = raw[:, 3:] / LSB_PER_RPS
+        axes = (lin[:, 1], lin[:, 0], lin[:, 2], gyr[:, 1], gyr[:, 0], gyr[:, 2])
+        lists = [a.tolist() for a in axes]
+        samples = list(zip(*lists))
+
+        def stats_loop():
+            stats = MotionStats()
+            for s in samples:
+                stats.update(*s)
+            stats.determine_motion()
+        results["determine_motion lists %s" % label] = timeit(lambda: determine_motion_lists(*lists), 1, 3)
+        results["MotionStats streaming %s" % label] = timeit(stats_loop, 1, 3)
+        stats = MotionStats()
+        for s in samples:
+            stats.update(*s)
+        results["MotionStats at release %s" % label] = timeit(stats.determine_motion, 1000)
+        results["motion_averages %s" % label] = timeit(lambda: motion_averages(*axes), 1, 3)
+        results["motion_features %s" % label] = timeit(
+            lambda: motion_features(wheel_frame(lin, gyr), dt), 1, 3)
+
+        wheel = build_wheel(raw, RATE)
+        results["simulated session %s" % label] = timeit(
+            lambda: asyncio.run(run_session(wheel, hold)), 1, 3)
+    return results
+
+
+# Samples until the gravity estimate is within 2 degrees on a tilted sensor
+# that is shaken for the first `shake` seconds and then rests: identity start
+# vs accel initialization, with and without warm-up
+def convergence(tilt_deg=30.0, seconds=60.0, shake=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * RATE)
+    roll = np.radians(tilt_deg)
+    pitch = np.radians(tilt_deg / 2)
+    g = np.array([-np.sin(pitch), np.sin(roll) * np.cos(pitch), np.cos(roll) * np.cos(pitch)])
+    raw = np.empty((n, 6))
+    raw[:, :3] = g * LSB_PER_G + rng.normal(0, 40, (n, 3))
+    raw[:, 3:] = rng.normal(0, 5, (n, 3))
+    m = int(shake * RATE)
+    t = np.arange(m) / RATE
+    raw[:m, :3] += 4000 * np.sin(2 * np.pi * 2.0 * t[:, None] + np.array([0.0, 1.0, 2.0]))
+    rows = raw.tolist()
+    dt = 1.0 / RATE
+
+    def run(kernel):
+        quats = np.empty((n, 4))
+        for i, row in enumerate(rows):
+            kernel.update(row[0], row[1], row[2], row[3], row[4], row[5], dt)
+            quats[i] = kernel.q
+        return convergence_samples(quats, g)
+
+    results = {"identity start": run(FusionKernel())}
+    kernel = FusionKernel()
+    kernel.initialize(*raw[:10, :3].mean(axis=0), warmup_gain=MADGWICK_GAIN)
+    results["accel init"] = run(kernel)
+    kernel = FusionKernel()
+    kernel.initialize(*raw[:10, :3].mean(axis=0))
+    results["accel init + warm-up"] = run(kernel)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path micro-benchmarks")
+    parser.add_argument("--save", help="write results as JSON (a baseline)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    results = per_call()
+    results.update(per_session())
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    for name, seconds in results.items():
+        line = "%-36s %12.3f us" % (name, seconds * 1e6)
+        if name in baseline:
+            line += "   baseline %12.3f us  (%.2fx)" % (baseline[name] * 1e6, baseline[name] / seconds)
+        print(line)
+
+    converge = convergence()
+    for name, samples in converge.items():
+        print("%-36s %12d samples (%.2f s at %g Hz)" % ("converge: " + name, samples, samples / RATE, RATE))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "machine": platform.machine(),
+                "python": platform.python_version(),
+                "results": results,
+                "convergence": converge,
+            }, f, indent=2)
+        print("saved", args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import os
+import time
+import numpy as np
+from sensor_config import DEFAULT_CONFIG
+
+CALIBRATION_FILE = "calibration.json"
+TEMP_STEP = 5.0             # degC per cache bucket
+MAX_TEMP_DELTA = 10.0       # furthest cached bucket lookup() falls back to
+WINDOW = 100                # samples per stationary test / estimate
+BLEND = 0.2                 # weight of each new idle estimate
+GYRO_STILL_DPS = 0.5        # max per-axis gyro std while stationary
+ACCEL_STILL_G = 0.01        # max accel-norm std while stationary
+ACCEL_NORM_TOL_G = 0.1      # mean accel norm must be within this of 1 g
+
+
+# ICM-20948 die temperature in degC from the driver's tmpRaw after getAgmt(),
+# or None if the backend doesn't report one
+def sensor_temperature(imu):
+    raw = getattr(imu, "tmpRaw", None)
+    if raw is None:
+        return None
+    return (raw - 21.0) / 333.87 + 21.0
+
+
+def sensor_key(imu):
+    address = getattr(imu, "address", None)
+    return "icm20948@%#04x" % address if address is not None else type(imu).__name__
+
+
+# Bias estimation from stationary stretches of raw samples. Gyro bias is the
+# mean rate at rest. Accel offset is the error of the measured gravity vector's
+# length, along its direction: one resting pose can't separate offsets per axis
+# from tilt. Calibrations are dicts (raw counts):
+#   {"gyro_bias": [gx, gy, gz], "accel_offset": [ax, ay, az],
+#    "temperature": degC or None, "windows": n, "updated": unix time}
+class Calibrator:
+    def __init__(self, calibration=None, config=DEFAULT_CONFIG, window=WINDOW, blend=BLEND):
+        self.calibration = calibration
+        self.window = window
+        self.blend = blend
+        lsb_per_dps = config.lsb_per_rps * np.pi / 180
+        self.gyro_still = GYRO_STILL_DPS * lsb_per_dps
+        self.accel_still = ACCEL_STILL_G * config.lsb_per_g
+        self.accel_tol = ACCEL_NORM_TOL_G * config.lsb_per_g
+        self.lsb_per_g = config.lsb_per_g
+
+    def stationary(self, raw):
+        norm = np.sqrt((raw[:, :3] ** 2).sum(axis=1))
+        return (raw[:, 3:].std(axis=0).max() < self.gyro_still
+                and norm.std() < self.accel_still
+                and abs(norm.mean() - self.lsb_per_g) < self.accel_tol)
+
+    def estimate(self, raw):
+        acc = raw[:, :3].mean(axis=0)
+        norm = np.sqrt((acc * acc).sum())
+        return raw[:, 3:].mean(axis=0), acc * (1.0 - self.lsb_per_g / norm)
+
+    # Feed (n, 6) raw ax..gz samples; every stationary window refines the
+    # calibration (the first replaces it outright). Returns True if it changed.
+    def feed(self, raw, temperature=None):
+        raw = np.asarray(raw, dtype=float).reshape(-1, 6)
+        changed = False
+        for start in range(0, len(raw) - self.window + 1, self.window):
+            block = raw[start:start + self.window]
+            if not self.stationary(block):
+                continue
+            gyro_bias, accel_offset = self.estimate(block)
+            cal = self.calibration
+            if cal is None:
+                cal = self.calibration = {"windows": 0}
+            else:
+                w = self.blend
+                gyro_bias = (1 - w) * np.asarray(cal["gyro_bias"]) + w * gyro_bias
+                accel_offset = (1 - w) * np.asarray(cal["accel_offset"]) + w * accel_offset
+            cal["gyro_bias"] = gyro_bias.tolist()
+            cal["accel_offset"] = accel_offset.tolist()
+            cal["windows"] += 1
+            changed = True
+        if changed:
+            self.calibration["temperature"] = temperature
+            self.calibration["updated"] = time.time()
+        return changed
+
+
+# Calibrations on disk, one JSON file keyed by sensor and TEMP_STEP bucket,
+# so a restart picks up where the last run left off
+class CalibrationStore:
+    def __init__(self, path=CALIBRATION_FILE):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def bucket(temperature):
+        if temperature is None:
+            return "any"
+        return "%d" % (round(temperature / TEMP_STEP) * TEMP_STEP)
+
+    # Calibration for this sensor at the nearest cached temperature (within
+    # MAX_TEMP_DELTA), or None
+    def lookup(self, sensor, temperature=None):
+        buckets = self.entries.get(sensor)
+        if not buckets:
+            return None
+        key = self.bucket(temperature)
+        if key in buckets:
+            return buckets[key]
+        if temperature is None:
+            return None
+        temps = [k for k in buckets if k != "any"]
+        if not temps:
+            return buckets.get("any")
+        nearest = min(temps, key=lambda k: abs(float(k) - temperature))
+        if abs(float(nearest) - temperature) > MAX_TEMP_DELTA:
+            return None
+        return buckets[nearest]
+
+    # Write atomically so a power cut leaves the old file intact
+    def save(self, sensor, calibration):
+        key = self.bucket(calibration.get("temperature"))
+        self.entries.setdefault(sensor, {})[key] = dict(calibration)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+# Blocking startup calibration: collect `samples` readings and estimate from
+# the stationary windows among them. Returns the calibration or None.
+def calibrate_now(imu, calibrator, samples=2 * WINDOW, timeout=10.0):
+    raw = []
+    deadline = time.monotonic() + timeout
+    while len(raw) < samples and time.monotonic() < deadline:
+        if imu.dataReady():
+            imu.getAgmt()
+            raw.append((imu.axRaw, imu.ayRaw, imu.azRaw, imu.gxRaw, imu.gyRaw, imu.gzRaw))
+        else:
+            time.sleep(0.001)
+    if raw and calibrator.feed(raw, sensor_temperature(imu)):
+        return calibrator.calibration
+    return None
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# Orientation-fusion engines behind the FusionKernel interface, selectable by
+# name, and a harness comparing their per-sample cost and gravity-removal
+# error. Run as a script for the comparison.
+import argparse
+import math
+import time
+import numpy as np
+
+from fusion import (FusionKernel, G_TO_MS2, LSB_PER_G, LSB_PER_RPS, gravity_from_quaternions,
+                    sample_periods)
+from motion import motion_averages
+
+
+# Mahony: proportional + integral feedback of the accel/gravity cross product
+# onto the gyro rate. gain is K_p; K_i accumulates a gyro-bias estimate.
+class MahonyKernel(FusionKernel):
+    name = "mahony"
+    DEFAULT_GAIN = 1.0          # ahrs.filters.Mahony k_P
+    WARMUP_GAIN = 10.0
+    KI = 0.3                    # ahrs.filters.Mahony k_I
+
+    def __init__(self, q=None, gain=None, **kwargs):
+        super().__init__(q, gain, **kwargs)
+        self.ix = self.iy = self.iz = 0.0
+
+    def reset(self, q=None):
+        super().reset(q)
+        self.ix = self.iy = self.iz = 0.0
+
+    def set_bias(self, *args, **kwargs):
+        super().set_bias(*args, **kwargs)
+        self.ix = self.iy = self.iz = 0.0
+
+    def step(self, q0, q1, q2, q3, gx, gy, gz, ax, ay, az, dt, gain):
+        a_norm = math.sqrt(ax*ax + ay*ay + az*az)
+        if a_norm > 0:
+            ax /= a_norm
+            ay /= a_norm
+            az /= a_norm
+            # estimated gravity direction, as gravity_from_quaternion
+            vx = 2.0 * (q1 * q3 - q0 * q2)
+            vy = 2.0 * (q0 * q1 + q2 * q3)
+            vz = q0*q0 - q1*q1 - q2*q2 + q3*q3
+            ex = ay * vz - az * vy
+            ey = az * vx - ax * vz
+            ez = ax * vy - ay * vx
+            ki_dt = self.KI * dt
+            self.ix += ki_dt * ex
+            self.iy += ki_dt * ey
+            self.iz += ki_dt * ez
+            gx += gain * ex + self.ix
+            gy += gain * ey + self.iy
+            gz += gain * ez + self.iz
+
+        h = 0.5 * dt
+        q0, q1, q2, q3 = (q0 + h * (-q1*gx - q2*gy - q3*gz),
+                          q1 + h * ( q0*gx + q2*gz - q3*gy),
+                          q2 + h * ( q0*gy - q1*gz + q3*gx),
+                          q3 + h * ( q0*gz + q1*gy - q2*gx))
+        q_norm = math.sqrt(q0*q0 + q1*q1 + q2*q2 + q3*q3)
+        return q0 / q_norm, q1 / q_norm, q2 / q_norm, q3 / q_norm
+
+
+# The roll/pitch complementary filter of IMU_test_gravity.py: gyro-integrated
+# Euler angles pulled towards the accel tilt at `gain` per second (0.02 per
+# sample at 100 Hz, the script's ALPHA = 0.98), yaw gyro-only. Body rates go
+# through the Euler kinematics rather than straight onto the angles, which
+# only holds near level. Angles are kept between steps and re-derived when
+# something else set the quaternion.
+class ComplementaryKernel(FusionKernel):
+    name = "complementary"
+    DEFAULT_GAIN = 2.0
+    WARMUP_GAIN = 20.0
+
+    def __init__(self, q=None, gain=None, **kwargs):
+        super().__init__(q, gain, **kwargs)
+        self.q_out = None
+
+    def reset(self, q=None):
+        super().reset(q)
+        self.q_out = None
+
+    def step(self, q0, q1, q2, q3, gx, gy, gz, ax, ay, az, dt, gain):
+        if (q0, q1, q2, q3) != self.q_out:
+            self.roll = math.atan2(2.0 * (q0*q1 + q2*q3), 1.0 - 2.0 * (q1*q1 + q2*q2))
+            self.pitch = math.asin(max(-1.0, min(1.0, 2.0 * (q0*q2 - q3*q1))))
+            self.yaw = math.atan2(2.0 * (q0*q3 + q1*q2), 1.0 - 2.0 * (q2*q2 + q3*q3))
+        # body rates -> Euler angle rates
+        roll, pitch = self.roll, self.pitch
+        sr, cr = math.sin(roll), math.cos(roll)
+        cp = math.cos(pitch)
+        cp = cp if abs(cp) > 1e-6 else 1e-6
+        tp = math.sin(pitch) / cp
+        yaw = self.yaw + (sr * gy + cr * gz) / cp * dt
+        roll += (gx + (sr * gy + cr * gz) * tp) * dt
+        pitch += (cr * gy - sr * gz) * dt
+        if ax or ay or az:
+            k = min(1.0, gain * dt)
+            roll_acc = math.atan2(ay, az)
+            pitch_acc = math.atan2(-ax, math.sqrt(ay*ay + az*az))
+            roll += k * math.remainder(roll_acc - roll, 2 * math.pi)
+            pitch += k * (pitch_acc - pitch)
+        self.roll, self.pitch, self.yaw = roll, pitch, yaw
+
+        # Euler (ZYX) -> quaternion
+        cr, sr = math.cos(0.5 * roll), math.sin(0.5 * roll)
+        cp, sp = math.cos(0.5 * pitch), math.sin(0.5 * pitch)
+        cy, sy = math.cos(0.5 * yaw), math.sin(0.5 * yaw)
+        self.q_out = (cr*cp*cy + sr*sp*sy,
+                      sr*cp*cy - cr*sp*sy,
+                      cr*sp*cy + sr*cp*sy,
+                      cr*cp*sy - sr*sp*cy)
+        return self.q_out
+
+
+ENGINES = {cls.name: cls for cls in (FusionKernel, MahonyKernel, ComplementaryKernel)}
+
+
+# A fusion kernel by engine name ("madgwick", "mahony", "complementary")
+def make_kernel(engine="madgwick", **kwargs):
+    try:
+        cls = ENGINES[engine]
+    except KeyError:
+        raise ValueError("unknown fusion engine %r (have %s)" % (engine, ", ".join(ENGINES)))
+    return cls(**kwargs)
+
+
+# Synthetic trace with known truth: the sensor turns at a smoothly varying
+# rate while being shaken. Returns raw (N,6) counts, true gravity directions
+# (N,3) and true linear acceleration (N,3, m/s^2), all in the sensor frame.
+def truth_trace(seconds=60.0, rate=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * rate)
+    dt = 1.0 / rate
+    t = np.arange(n) * dt
+    f = rng.uniform(0.1, 0.6, 3)
+    w = 0.8 * np.sin(2 * np.pi * f * t[:, None] + rng.uniform(0, 2 * np.pi, 3))
+    lin = 3.0 * np.sin(2 * np.pi * rng.uniform(0.5, 2.0, 3) * t[:, None] + rng.uniform(0, 2 * np.pi, 3))
+    lin *= (np.sin(2 * np.pi * 0.05 * t) > 0)[:, None]
+
+    # exact quaternion propagation at the sample rate
+    quats = np.empty((n, 4))
+    q = np.array([1.0, 0.0, 0.0, 0.0])
+    for i in range(n):
+        quats[i] = q
+        wx, wy, wz = w[i]
+        rate_norm = math.sqrt(wx*wx + wy*wy + wz*wz)
+        half = 0.5 * rate_norm * dt
+        if rate_norm > 0:
+            s = math.sin(half) / rate_norm
+            dq = (math.cos(half), wx * s, wy * s, wz * s)
+            q = np.array([
+                q[0]*dq[0] - q[1]*dq[1] - q[2]*dq[2] - q[3]*dq[3],
+                q[0]*dq[1] + q[1]*dq[0] + q[2]*dq[3] - q[3]*dq[2],
+                q[0]*dq[2] - q[1]*dq[3] + q[2]*dq[0] + q[3]*dq[1],
+                q[0]*dq[3] + q[1]*dq[2] - q[2]*dq[1] + q[3]*dq[0],
+            ])
+    g = gravity_from_quaternions(quats)
+
+    raw = np.empty((n, 6))
+    raw[:, :3] = (g + lin / G_TO_MS2) * LSB_PER_G + rng.normal(0, 40, (n, 3))
+    raw[:, 3:] = w * LSB_PER_RPS + rng.normal(0, 5, (n, 3))
+    return np.clip(np.round(raw), -32768, 32767), g, lin
+
+
+# Run one kernel over raw samples. Returns quaternions, linear acceleration
+# and seconds per sample (update() plus keeping its output).
+def run_kernel(kernel, raw, dt):
+    n = len(raw)
+    dt = np.broadcast_to(np.asarray(dt, dtype=float), (n,)).tolist()
+    rows = raw.tolist()
+    quats = [None] * n
+    lins = [None] * n
+    q = kernel.q
+    update = kernel.update
+    kernel.initialize(*raw[:10, :3].mean(axis=0))
+    start = time.perf_counter()
+    for i, row in enumerate(rows):
+        lins[i] = update(row[0], row[1], row[2], row[3], row[4], row[5], dt[i])
+        quats[i] = (q[0], q[1], q[2], q[3])
+    cost = time.perf_counter() - start
+    return np.array(quats).reshape(n, 4), np.array(lins).reshape(n, 3), cost / n if n else 0.0
+
+
+# Dominant motion of a recording, as replay.reprocess computes it
+def dominant_motion(raw, lin, gyr_scale):
+    gyr = raw[:, 3:] * gyr_scale
+    averages = motion_averages(lin[:, 1], lin[:, 0], lin[:, 2], gyr[:, 1], gyr[:, 0], gyr[:, 2])
+    return averages.index(max(averages))
+
+
+def compare_truth(engines, seconds, rate, seed):
+    raw, g, lin_true = truth_trace(seconds, rate, seed)
+    print("synthetic trace: %d samples at %g Hz" % (len(raw), rate))
+    print("%-14s %10s %12s %12s %14s" % ("engine", "us/sample", "grav err", "p95 err", "lin rms err"))
+    for name in engines:
+        quats, lin, cost = run_kernel(make_kernel(name), raw, 1.0 / rate)
+        cos_err = np.clip((gravity_from_quaternions(quats) * g).sum(axis=1), -1.0, 1.0)
+        err = np.degrees(np.arccos(cos_err))
+        lin_err = np.sqrt(((lin - lin_true) ** 2).sum(axis=1).mean())
+        print("%-14s %10.2f %10.2f deg %8.2f deg %10.3f m/s^2"
+              % (name, cost * 1e6, err.mean(), np.percentile(err, 95), lin_err))
+
+
+# Recorded sessions have no ground truth; report cost and how often each
+# engine picks the same dominant motion as the first engine listed
+def compare_sessions(engines, paths):
+    from replay import session_files, load_records, split_sessions
+    sessions = []
+    for path in session_files(paths):
+        records, config, _ = load_records(path)
+        sessions += [(s, config) for s in split_sessions(records)]
+    if not sessions:
+        print("no recorded sessions under", " ".join(paths))
+        return
+    costs = {name: 0.0 for name in engines}
+    agree = {name: 0 for name in engines}
+    samples = 0
+    for session, config in sessions:
+        raw = np.asarray(session["raw"], dtype=float)
+        dt = sample_periods(session["t"])
+        picks = {}
+        for name in engines:
+            kernel = make_kernel(name, config=config)
+            if "bias" in session.dtype.names:
+                kernel.set_bias(session["bias"][0, 3:], session["bias"][0, :3])
+            _, lin, cost = run_kernel(kernel, raw, dt)
+            costs[name] += cost * len(raw)
+            picks[name] = dominant_motion(raw, lin, kernel.gyr_scale)
+        samples += len(raw)
+        for name in engines:
+            agree[name] += picks[name] == picks[engines[0]]
+    print("recorded: %d sessions, %d samples" % (len(sessions), samples))
+    print("%-14s %10s %16s" % ("engine", "us/sample", "same as " + engines[0]))
+    for name in engines:
+        print("%-14s %10.2f %13d/%d" % (name, costs[name] / samples * 1e6, agree[name], len(sessions)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare orientation-fusion engines")
+    parser.add_argument("sessions", nargs="*", help="recorded session files or directories")
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help="comma-separated engines; the first is the reference for recordings")
+    parser.add_argument("--seconds", type=float, default=60.0, help="synthetic trace length")
+    parser.add_argument("--rate", type=float, default=100.0, help="synthetic sample rate (Hz)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    engines = args.engines.split(",")
+    for name in engines:
+        make_kernel(name)
+    compare_truth(engines, args.seconds, args.rate, args.seed)
+    if args.sessions:
+        print()
+        compare_sessions(engines, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
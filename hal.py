@@ -0,0 +1,208 @@
+import asyncio
+import threading
+import time
+import numpy as np
+
+SPIN_WAIT = 0.0005      # busy-wait the last 0.5 ms before a deadline
+
+
+# Backends:
+#   gpio  - RPi.GPIO module API (setmode/setup/output/input/add_event_detect/cleanup)
+#   imu   - qwiic_icm20948.QwiicIcm20948 API (begin/dataReady/getAgmt/axRaw..gzRaw)
+#   mixer - pygame.mixer API (pre_init/init/Sound/stop/quit)
+#   clock - now/sleep/wait_until/async_sleep, real or simulated
+
+# Real hardware, imported only when asked for so the rest runs off the Pi
+def pi_backends():
+    import RPi.GPIO as GPIO
+    import qwiic_icm20948
+    import pygame
+    return GPIO, qwiic_icm20948.QwiicIcm20948(), pygame.mixer
+
+
+# What a motor worker process needs (see motor_workers.py): gpio, mixer, clock.
+# Module-level functions so they can be handed to a child process.
+def pi_motor_backends():
+    import RPi.GPIO as GPIO
+    import pygame
+    GPIO.setmode(GPIO.BCM)
+    return GPIO, pygame.mixer, RealClock()
+
+
+def sim_motor_backends():
+    return SimGPIO(), SimMixer(), SimClock()
+
+
+class RealClock:
+    def __init__(self, spin_wait=SPIN_WAIT):
+        self.spin_wait = spin_wait
+
+    def now(self):
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    # Sleep until shortly before the deadline, then spin on the clock for the rest
+    def wait_until(self, deadline):
+        remaining = deadline - time.perf_counter()
+        if remaining > self.spin_wait:
+            time.sleep(remaining - self.spin_wait)
+        while time.perf_counter() < deadline:
+            pass
+
+    async def async_sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+# Virtual time: waiting just moves the clock forward, so runs go as fast as
+# the code under test allows
+class SimClock:
+    def __init__(self, start=0.0):
+        self.t = start
+        self.lock = threading.Lock()
+
+    def now(self):
+        return self.t
+
+    def sleep(self, seconds):
+        with self.lock:
+            if seconds > 0:
+                self.t += seconds
+
+    def wait_until(self, deadline):
+        with self.lock:
+            if deadline > self.t:
+                self.t = deadline
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+class SimGPIO:
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.callbacks = {}
+        self.writes = 0
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, channel, direction):
+        self.levels.setdefault(channel, 0)
+
+    def output(self, channel, value):
+        self.writes += 1
+        if isinstance(channel, (list, tuple)):
+            for pin, val in zip(channel, value):
+                self.levels[pin] = val
+        else:
+            self.levels[channel] = value
+
+    def input(self, channel):
+        return self.levels.get(channel, 0)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        self.callbacks[channel] = callback
+
+    def remove_event_detect(self, channel):
+        self.callbacks.pop(channel, None)
+
+    # Drive an input pin, firing its edge callback like the real library would
+    def set_input(self, channel, level):
+        if self.levels.get(channel, 0) == level:
+            return
+        self.levels[channel] = level
+        callback = self.callbacks.get(channel)
+        if callback is not None:
+            callback(channel)
+
+    def cleanup(self):
+        self.levels.clear()
+        self.callbacks.clear()
+
+
+# Replays an (N,6) trace of raw ax, ay, az, gx, gy, gz counts at `rate` Hz,
+# looping at the end. A sample becomes ready when the clock reaches it.
+class SimIMU:
+    def __init__(self, trace, rate=100.0, clock=None):
+        self.trace = np.asarray(trace, dtype=float).reshape(-1, 6).tolist()
+        self.period = 1.0 / rate
+        self.clock = clock or RealClock()
+        self.connected = True
+        self.i = 0
+        self.next_t = self.clock.now()
+        self.axRaw = self.ayRaw = self.azRaw = 0
+        self.gxRaw = self.gyRaw = self.gzRaw = 0
+
+    def begin(self):
+        return True
+
+    def dataReady(self):
+        return self.clock.now() >= self.next_t
+
+    def getAgmt(self):
+        row = self.trace[self.i % len(self.trace)]
+        self.axRaw, self.ayRaw, self.azRaw, self.gxRaw, self.gyRaw, self.gzRaw = row
+        self.i += 1
+        self.next_t += self.period
+        return True
+
+
+# Synthetic wheel-shake trace in raw counts (16384 LSB/g, 32.8 LSB/dps)
+def synthetic_trace(n, rate=100.0, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(n) / rate
+    f = rng.uniform(0.3, 2.0, 6)
+    amp = rng.uniform(500, 4000, 6)
+    trace = amp * np.sin(2 * np.pi * f * t[:, None] + rng.uniform(0, 2 * np.pi, 6))
+    trace[:, 2] += 16384.0
+    trace += rng.normal(0, 50, trace.shape)
+    return np.clip(np.round(trace), -32768, 32767)
+
+
+class SimSound:
+    def __init__(self, mixer, name):
+        self.mixer = mixer
+        self.name = name
+
+    def play(self):
+        self.mixer.playing = self.name
+        self.mixer.plays += 1
+        return self
+
+
+class SimMixer:
+    def __init__(self):
+        self.playing = None
+        self.plays = 0
+
+    def pre_init(self, **kwargs):
+        pass
+
+    def init(self):
+        pass
+
+    def Sound(self, path):
+        return SimSound(self, path)
+
+    def stop(self):
+        self.playing = None
+
+    def get_busy(self):
+        return self.playing is not None
+
+    def quit(self):
+        self.playing = None
@@ -0,0 +1,136 @@
+import time
+import numpy as np
+from acquisition import AcquisitionThread
+
+# ICM-20948 user bank 0 registers (datasheet DS-000189, section 7)
+REG_BANK_SEL = 0x7F
+USER_CTRL = 0x03
+USER_CTRL_FIFO_EN = 0x40
+INT_STATUS_2 = 0x1B     # FIFO overflow flags, cleared on read
+FIFO_EN_1 = 0x66
+FIFO_EN_2 = 0x67
+FIFO_EN_2_ACCEL_GYRO = 0x1E     # ACCEL_FIFO_EN | GYRO_Z | GYRO_Y | GYRO_X
+FIFO_RST = 0x68
+FIFO_MODE = 0x69        # 0 = stream (overwrite oldest), 1 = snapshot
+FIFO_COUNTH = 0x70
+FIFO_R_W = 0x72
+
+FRAME_BYTES = 12        # accel x/y/z then gyro x/y/z, big-endian int16
+# SMBus block reads top out at 32 bytes; stay on a frame boundary
+BLOCK_BYTES = 24
+
+
+# Register-level access to the on-chip FIFO through the qwiic driver's I2C
+# handle. The sensor queues accel+gyro frames at its own output data rate and
+# we drain them in bursts instead of one dataReady/getAgmt pair per sample.
+class IcmFifo:
+    def __init__(self, imu, block_bytes=BLOCK_BYTES):
+        self.i2c = imu._i2c
+        self.address = imu.address
+        self.block_bytes = block_bytes - block_bytes % FRAME_BYTES
+
+    def write(self, reg, value):
+        self.i2c.writeByte(self.address, reg, value)
+
+    def read(self, reg):
+        return self.i2c.readByte(self.address, reg)
+
+    def enable(self):
+        self.write(REG_BANK_SEL, 0)
+        self.write(FIFO_EN_1, 0)
+        self.write(FIFO_EN_2, FIFO_EN_2_ACCEL_GYRO)
+        self.write(FIFO_MODE, 0)
+        self.reset()
+        self.write(USER_CTRL, self.read(USER_CTRL) | USER_CTRL_FIFO_EN)
+
+    def disable(self):
+        self.write(REG_BANK_SEL, 0)
+        self.write(USER_CTRL, self.read(USER_CTRL) & ~USER_CTRL_FIFO_EN & 0xFF)
+        self.write(FIFO_EN_2, 0)
+
+    def reset(self):
+        self.write(FIFO_RST, 0x1F)
+        self.write(FIFO_RST, 0x00)
+
+    def count(self):
+        hi, lo = self.i2c.readBlock(self.address, FIFO_COUNTH, 2)
+        return ((hi & 0x1F) << 8) | lo
+
+    def overflowed(self):
+        return bool(self.read(INT_STATUS_2) & 0x1F)
+
+    # Read every complete frame in the FIFO; returns an (n, 6) int16 array of
+    # raw ax, ay, az, gx, gy, gz
+    def drain(self):
+        nbytes = self.count() // FRAME_BYTES * FRAME_BYTES
+        data = bytearray()
+        while nbytes > 0:
+            chunk = min(self.block_bytes, nbytes)
+            data += bytes(self.i2c.readBlock(self.address, FIFO_R_W, chunk))
+            nbytes -= chunk
+        return np.frombuffer(bytes(data), dtype=">i2").reshape(-1, 6).astype(np.int16)
+
+
+# Acquisition thread in FIFO mode: each poll drains a burst of frames and
+# writes them to the ring buffer in one go. Frames carry no timestamps, so
+# they are spaced at the sensor's sample period, ending at the drain time.
+# An overflow in stream mode overwrites the oldest bytes mid-frame, so the
+# FIFO is reset and that burst dropped; the next burst's timestamps show
+# the gap.
+class FifoAcquisitionThread(AcquisitionThread):
+    def __init__(self, imu, buffer, rate, poll_interval=0.02, clock=None, fifo=None):
+        super().__init__(imu, buffer, poll_interval, clock, rate)
+        self.fifo = fifo or IcmFifo(imu)
+        self.fifo_overflows = 0
+
+    def poll_once(self):
+        timing = self.timing
+        perf = time.perf_counter
+        with self.busy:
+            if not self.recording.is_set():
+                return False
+            t0 = perf()
+            if self.fifo.overflowed():
+                self.fifo_overflows += 1
+                self.fifo.reset()
+                timing["poll"].add(perf() - t0)
+                return False
+            t1 = perf()
+            timing["poll"].add(t1 - t0)
+            raw = self.fifo.drain()
+            t2 = perf()
+            timing["read"].add(t2 - t1)
+            n = len(raw)
+            if n == 0:
+                return False
+
+            now = self.clock.now()
+            t = now - self.period * np.arange(n - 1, -1, -1)
+            if self.last_t is not None and t[0] <= self.last_t:
+                # the drain came early; keep timestamps increasing
+                t += self.last_t + self.period - t[0]
+            self.buffer.write_block(t, raw)
+            if self.last_t is None:
+                self.first_t = float(t[0])
+            else:
+                gap = t[0] - self.last_t
+                timing["gap"].add(gap)
+                if gap > self.max_gap:
+                    self.max_gap = gap
+            self.last_t = float(t[-1])
+            self.samples += n
+            timing["write"].add(perf() - t2)
+            # drained a burst; wait for the next one to build up
+            return False
+
+    def start_recording(self):
+        self.fifo.reset()
+        #the flags latch while the FIFO fills up idle; clear them
+        self.fifo.overflowed()
+        self.fifo_overflows = 0
+        super().start_recording()
+
+    def stats(self):
+        stats = super().stats()
+        stats["fifo_overflows"] = self.fifo_overflows
+        return stats
@@ -0,0 +1,61 @@
+import bisect
+
+# Bucket upper edges in seconds (10 us .. 100 ms), plus one overflow bucket
+BUCKETS = [10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6,
+           1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3]
+
+
+# Fixed-bucket latency histogram: add() is a bisect and a few increments
+class Histogram:
+    def __init__(self, name, buckets=BUCKETS):
+        self.name = name
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.n = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.n += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    # Upper edge of the bucket holding the p-th percentile (max if it overflows)
+    def percentile(self, p):
+        if not self.n:
+            return 0.0
+        rank = p / 100.0 * self.n
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        if not self.n:
+            return "%-8s      -" % self.name
+        return "%-8s n=%-6d mean %8.1f us  p50 <%8.1f us  p99 <%8.1f us  max %8.1f us" % (
+            self.name, self.n, self.total / self.n * 1e6,
+            self.percentile(50) * 1e6, self.percentile(99) * 1e6, self.max * 1e6)
+
+
+# A named set of histograms, one per stage of a loop
+class StageTimer:
+    def __init__(self, *stages):
+        self.stages = {name: Histogram(name) for name in stages}
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    def reset(self):
+        for h in self.stages.values():
+            h.reset()
+
+    def summary(self):
+        return [h.summary() for h in self.stages.values()]
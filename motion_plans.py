@@ -0,0 +1,151 @@
+import array
+import time
+from audio import MUSIC
+from motion import DIMENSIONS
+from stepper import (FSCW, FSACW, compile_waveform, plan_move, peak_accel, STEPS_PER_REV,
+                     ACCEL_RPS2, HOMING_RPS, MAX_RPS)
+
+SPIN_PAUSE = 7          # seconds on the arrow before homing
+PEAK_ACCEL_SLACK = 1.02 # check() allowance over ACCEL_RPS2 for step quantisation
+
+# Every outcome psuedorandom() and determine_motion() can produce
+DIRECTIONS = (0, 1)
+ROTATIONS = range(2, 12)
+RUNTIMES = range(3, 8)
+
+# Arrow angle (degrees) and clip for each dimension
+ARROWS = {
+    "environmental": (26, "Environmental.mp3"),
+    "emotional": (70, "Emotional.mp3"),
+    "physical": (114, "Physical.mp3"),
+    "financial": (158, "Financial.mp3"),
+    "spiritual": (202, "Spiritual.mp3"),
+    "intellectual": (246, "Intellectual.mp3"),
+    "social": (290, "Social.mp3"),
+    "occupational": (334, "Occupational.mp3"),
+}
+DIMENSION_INDEX = {name: i for i, name in enumerate(DIMENSIONS)}
+
+# Longest main move, in steps: most rotations plus almost a full turn to the arrow
+MAX_STEPS = (ROTATIONS[-1] + 1) * STEPS_PER_REV
+
+
+def arrow_point(direction, dimension):
+    arrow = ARROWS.get(dimension, (0, MUSIC))[0]
+    return arrow / 360.0 if direction == 0 else (360 - arrow) / 360.0
+
+
+# Cruise speed (rev/s) of the main move for a runtime. The old unramped moves
+# ran at 1 / (runtime / 500 * STEPS_PER_REV) from the first step, capping the
+# fastest (runtime 3) at a speed the motor can start at. Ramped moves only
+# start at START_RPS, so the same speeds are scaled up until the fastest
+# runtime cruises at max_rps.
+def cruise_rps(runtime, max_rps=MAX_RPS):
+    return max_rps * RUNTIMES[0] / runtime
+
+
+# Everything a spin needs, ready to hand to StepScheduler.run: the ramped main
+# rotation onto the dimension's arrow, the clip for that arrow and the homing
+# move back. Waveforms are shared per direction and may be longer than the
+# move; the times arrays (steps + 1 offsets) set the length.
+class MotionPlan:
+    def __init__(self, direction, rotations, dimension, runtime, waveform, times, audio, sound,
+                 home_waveform, home_times, pause=SPIN_PAUSE):
+        self.direction = direction
+        self.rotations = rotations
+        self.dimension = dimension
+        self.runtime = runtime
+        self.waveform = waveform
+        self.times = times
+        self.audio = audio
+        self.sound = sound
+        self.home_waveform = home_waveform
+        self.home_times = home_times
+        self.steps = len(times) - 1
+        self.home_steps = len(home_times) - 1
+        self.duration = times[-1] + pause + home_times[-1]
+
+
+# All 2 x 10 x 8 x 5 spin outcomes planned once at startup, so starting a spin
+# is an index lookup. Step offsets are stored as array('d') (8 bytes a step);
+# homing moves depend only on direction and dimension and are shared.
+# max_rps is the fastest main-move cruise speed (see cruise_rps); s_curve
+# plans smoothstep ramps instead of constant acceleration.
+class PlanCache:
+    def __init__(self, audio_engine=None, pause=SPIN_PAUSE, max_rps=MAX_RPS, s_curve=False):
+        start = time.perf_counter()
+        self.pause = pause
+        self.max_rps = max_rps
+        self.s_curve = s_curve
+        self.sounds = audio_engine.sounds if audio_engine is not None else {}
+        self.waveforms = {0: compile_waveform(FSCW, MAX_STEPS), 1: compile_waveform(FSACW, MAX_STEPS)}
+        self.homes = {}
+        for direction in DIRECTIONS:
+            for dimension in DIMENSIONS:
+                steps = int(STEPS_PER_REV * arrow_point(direction, dimension))
+                self.homes[direction, dimension] = array.array(
+                    "d", plan_move(steps, HOMING_RPS, s_curve=s_curve))
+        self.plans = [
+            self.build(direction, rotations, dimension, runtime)
+            for direction in DIRECTIONS
+            for rotations in ROTATIONS
+            for dimension in DIMENSIONS
+            for runtime in RUNTIMES
+        ]
+        self.misses = 0
+        self.build_time = time.perf_counter() - start
+
+    @staticmethod
+    def index(direction, rotations, dimension, runtime):
+        return (((direction * len(ROTATIONS) + rotations - ROTATIONS[0]) * len(DIMENSIONS)
+                 + DIMENSION_INDEX[dimension]) * len(RUNTIMES) + runtime - RUNTIMES[0])
+
+    def build(self, direction, rotations, dimension, runtime):
+        point = arrow_point(direction, dimension)
+        steps = int((rotations + point) * STEPS_PER_REV)
+        times = array.array("d", plan_move(steps, cruise_rps(runtime, self.max_rps),
+                                           s_curve=self.s_curve))
+        home = self.homes.get((direction, dimension))
+        if home is None:
+            home = array.array("d", plan_move(int(STEPS_PER_REV * point), HOMING_RPS,
+                                              s_curve=self.s_curve))
+        audio = ARROWS.get(dimension, (0, MUSIC))[1]
+        waveforms = self.waveforms
+        if steps > MAX_STEPS:
+            waveforms = {0: compile_waveform(FSCW, steps), 1: compile_waveform(FSACW, steps)}
+        return MotionPlan(direction, rotations, dimension, runtime, waveforms[direction], times,
+                          audio, self.sounds.get(audio), waveforms[1 - direction], home, self.pause)
+
+    # The plan for a spin job; outcomes outside the table are built on the spot
+    def get(self, direction, rotations, dimension, runtime):
+        if (direction in DIRECTIONS and rotations in ROTATIONS and runtime in RUNTIMES
+                and dimension in DIMENSION_INDEX):
+            return self.plans[self.index(direction, rotations, dimension, runtime)]
+        self.misses += 1
+        return self.build(direction, rotations, dimension, runtime)
+
+    # Problems with the table, as strings (empty if every plan is usable)
+    def check(self):
+        problems = []
+        for plan in self.plans:
+            label = "%d/%d/%s/%d" % (plan.direction, plan.rotations, plan.dimension, plan.runtime)
+            if self.get(plan.direction, plan.rotations, plan.dimension, plan.runtime) is not plan:
+                problems.append("%s: indexed to the wrong plan" % label)
+            if plan.steps < plan.rotations * STEPS_PER_REV or plan.steps > len(plan.waveform):
+                problems.append("%s: %d steps" % (label, plan.steps))
+            if any(b <= a for a, b in zip(plan.times, plan.times[1:])):
+                problems.append("%s: step times not increasing" % label)
+            if self.sounds and plan.sound is None:
+                problems.append("%s: no clip %s" % (label, plan.audio))
+            for move, times in (("main", plan.times), ("homing", plan.home_times)):
+                peak = peak_accel(times)
+                if peak > ACCEL_RPS2 * PEAK_ACCEL_SLACK:
+                    problems.append("%s: %s move peaks at %.2f rev/s^2" % (label, move, peak))
+        return problems
+
+    def __len__(self):
+        return len(self.plans)
+
+    def nbytes(self):
+        homes = sum(h.itemsize * len(h) for h in self.homes.values())
+        return homes + sum(p.times.itemsize * len(p.times) for p in self.plans)
@@ -0,0 +1,117 @@
+import multiprocessing
+import time
+from hal import pi_motor_backends
+from audio import AudioEngine, MUSIC
+from stepper import StepScheduler
+from motion_plans import PlanCache, SPIN_PAUSE
+
+_STOP = None
+
+
+# Long-lived process driving one wheel. GPIO, the step scheduler, the motion
+# plans and (for the worker that plays audio) the mixer with every clip are
+# set up once when the process starts; after that each spin job from the
+# command queue only costs the move itself. Completion and timing go back on the shared results queue.
+class MotorWorker(multiprocessing.Process):
+    def __init__(self, name, pins, results, backends=pi_motor_backends, audio=False,
+                 spin_pause=SPIN_PAUSE):
+        super().__init__(name=name, daemon=True)
+        self.pins = list(pins)
+        self.commands = multiprocessing.Queue()
+        self.results = results
+        self.backends = backends
+        self.audio = audio
+        self.spin_pause = spin_pause
+
+    def run(self):
+        start = time.monotonic()
+        gpio, mixer, clock = self.backends()
+        for pin in self.pins:
+            gpio.setup(pin, gpio.OUT)
+            gpio.output(pin, 0)
+        stepper = StepScheduler(gpio, self.pins, clock)
+        audio_engine = AudioEngine(mixer) if self.audio else None
+        plans = PlanCache(audio_engine, self.spin_pause)
+        self.results.put(("ready", self.name, None, {"startup": time.monotonic() - start}))
+
+        try:
+            while True:
+                command = self.commands.get()
+                if command is _STOP:
+                    break
+                job_id, submitted, job = command
+                plan = plans.get(*job)
+                self.results.put(("done", self.name, job_id,
+                                  self.spin(stepper, audio_engine, clock, submitted, plan)))
+        finally:
+            if audio_engine is not None:
+                audio_engine.quit()
+            for pin in self.pins:
+                gpio.output(pin, 0)
+
+    # Same sequence as WheelRuntime.spin, run synchronously in this process
+    def spin(self, stepper, audio_engine, clock, submitted, plan):
+        start = time.monotonic()
+        if audio_engine is not None:
+            audio_engine.play(MUSIC)
+        main = stepper.run(plan.waveform, plan.times)
+        if audio_engine is not None:
+            audio_engine.play(plan.sound)
+        clock.sleep(self.spin_pause)
+        home = stepper.run(plan.home_waveform, plan.home_times)
+        return {
+            "queued": start - submitted,
+            "elapsed": time.monotonic() - start,
+            "main": main,
+            "home": home,
+        }
+
+
+# A set of motor workers, one per pin set, started once. submit() queues a
+# spin job on one wheel and returns its id; wait() collects results.
+class MotorPool:
+    def __init__(self, pin_sets, backends=pi_motor_backends, audio_worker=0, spin_pause=SPIN_PAUSE):
+        self.results = multiprocessing.Queue()
+        self.workers = [
+            MotorWorker("motor%d" % i, pins, self.results, backends, i == audio_worker, spin_pause)
+            for i, pins in enumerate(pin_sets)
+        ]
+        self.next_id = 0
+        self.done = {}
+        self.startup = {}
+
+    # Start every worker and wait until each has its hardware set up
+    def start(self, timeout=30.0):
+        for worker in self.workers:
+            worker.start()
+        deadline = time.monotonic() + timeout
+        while len(self.startup) < len(self.workers):
+            self.collect(max(0.0, deadline - time.monotonic()))
+        return self.startup
+
+    # job: (direction, rotations, dimension, runtime), as WheelRuntime.decide returns
+    def submit(self, wheel, job):
+        job_id = self.next_id
+        self.next_id += 1
+        self.workers[wheel].commands.put((job_id, time.monotonic(), tuple(job)))
+        return job_id
+
+    # Results for the given job ids, {job_id: (worker name, timing)}
+    def wait(self, job_ids, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(job_id in self.done for job_id in job_ids):
+            self.collect(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        return {job_id: self.done.pop(job_id) for job_id in job_ids}
+
+    def collect(self, timeout=None):
+        kind, name, job_id, info = self.results.get(timeout=timeout)
+        if kind == "ready":
+            self.startup[name] = info["startup"]
+        else:
+            self.done[job_id] = (name, info)
+
+    def close(self, timeout=5.0):
+        for worker in self.workers:
+            worker.commands.put(_STOP)
+        for worker in self.workers:
+            worker.join(timeout)
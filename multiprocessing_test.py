@@ -2,8 +2,7 @@
 import RPi.GPIO as GPIO
 import qwiic_icm20948
 import time
-import pygame
-from multiprocessing import Process
+from motor_workers import MotorPool
 
 GPIO.setmode(GPIO.BCM)
 
@@ -143,7 +142,7 @@ def dimension():
     elif dominant_motion == 4:
         return 'spiritual'
     elif dominant_motion == 5:
-        return 'intelectual'
+        return 'intellectual'
     elif dominant_motion == 6:
         return 'social'
     elif dominant_motion == 7:
@@ -158,98 +157,18 @@ print(result)
 print(dimension())
 
 
-FSCW = [
-    [1,0,0,1],
-    [1,0,1,0],
-    [0,1,1,0],
-    [0,1,0,1]
-]
-
-FSACW = [
-    [0,1,0,1],
-    [0,1,1,0],
-    [1,0,1,0],
-    [1,0,0,1]
-]
-
-def spin(pins, direction, rotations, dimension, runtime):
-        
-    if dimension == "environmental":
-            arrow = 26
-            audio = "Environmental.mp3"
-    elif dimension == "emotional":
-            arrow = 70
-            audio = "Emotional.mp3"
-    elif dimension == "physical":
-            arrow = 114
-            audio = "Physical.mp3"
-    elif dimension == "financial":
-            arrow = 158
-            audio = "Financial.mp3"
-    elif dimension == "spiritual":
-            arrow = 202
-            audio = "Spiritual.mp3"
-    elif dimension == "intelectual":
-            arrow = 246
-            audio = "Intellectual.mp3"
-    elif dimension == "social":
-            arrow = 290
-            audio = "Social.mp3"
-    elif dimension == "occupational":
-            arrow = 334
-            audio = "Occupational.mp3"
-            
-    if direction == 0:  # Clockwise
-        matrix = FSCW 
-        reverse = FSACW
-        arrow_point = arrow/360
-    else:  # Counterclockwise
-        matrix = FSACW 
-        reverse = FSCW
-        arrow_point = (360-arrow)/360
-
-
-    pygame.mixer.init()
-    pygame.mixer.music.load("si_music.mp3")
-    pygame.mixer.music.play()
-
-
-
-    for i in range(int((rotations + arrow_point)*50*4)):
-        turn = matrix[i % 4]
-        for pin, val in zip(pins, turn):
-            GPIO.output(pin, val)
-        time.sleep(runtime / 500)
-
-    pygame.mixer.music.stop()
-
-    pygame.mixer.music.load(audio)
-
-    pygame.mixer.music.play()
-
-    time.sleep(7)
-
-    for i in range(int(50*4*arrow_point)):
-        turn = reverse[i % 4]
-        for pin, val in zip(pins, turn):
-            GPIO.output(pin, val)
-        time.sleep(runtime / 500)
-
-#spin(result[0], result[1], dimension(), result[2])
-
-p1 = Process(target=spin, args=(pins_A, result[0], result[1], dimension(), result[2]))
-
-p2= Process(target=spin, args=(pins_B, 1-result[0], result[1], dimension(), result[2]))
-
-p1.start()
-p2.start()
-
-p1.join()
-p2.join()
-
-GPIO.cleanup()
-
+#one long-lived worker per wheel: GPIO and the mixer are set up once, then
+#every spin is just a job on that worker's command queue
+pool = MotorPool([pins_A, pins_B])
+print('workers ready:', pool.start())
 
+jobs = [pool.submit(0, (result[0], result[1], dimension(), result[2])),
+        pool.submit(1, (1-result[0], result[1], dimension(), result[2]))]
 
+for job_id, (worker, timing) in pool.wait(jobs).items():
+    print('%s: job %d took %.2f s (queued %.1f ms, %.3f rps)'
+          % (worker, job_id, timing['elapsed'], timing['queued'] * 1000, timing['main']['actual_rps']))
 
+pool.close()
 
+GPIO.cleanup()
@@ -0,0 +1,178 @@
+import os
+import queue
+import struct
+import threading
+import time
+import numpy as np
+from sensor_config import GYRO_BASE_RATE, DEFAULT_CONFIG, SensorConfig
+
+# Session files: one per day and setup, <directory>/YYYYMMDD.rec
+# (YYYYMMDD-1.rec, ... when the setup changes during a day), append-only.
+# 32-byte header followed by fixed-size records. The header is the magic,
+# the record size, the sensor setup the raw counts were taken with (accel
+# range in g, gyro range in dps, gyro sample-rate divider) and the name of the
+# fusion engine that produced the recorded quaternions and gains.
+# Version 2 files had a 16-byte header without the engine (always Madgwick);
+# version 1 files had no setup either and were all recorded with DEFAULT_CONFIG.
+MAGIC = b"WHLREC03"
+MAGIC_V2 = b"WHLREC02"
+MAGIC_V1 = b"WHLREC01"
+HEADER_SIZE = 32
+HEADER_SIZES = {MAGIC: HEADER_SIZE, MAGIC_V2: 16, MAGIC_V1: 16}
+HEADER_FORMAT_V2 = "<IBHB"
+HEADER_FORMAT = HEADER_FORMAT_V2 + "16s"
+# 36-byte records, without the filter inputs replay needs to match the live run
+RECORD_DTYPE_V1 = np.dtype([
+    ("session", "<u4"),     # session id = unix time the button was pressed
+    ("t", "<f4"),           # seconds since the session's first sample
+    ("raw", "<i2", (6,)),   # ax, ay, az, gx, gy, gz raw counts
+    ("q", "<f4", (4,)),     # fusion quaternion after this sample
+])
+RECORD_DTYPE = np.dtype(RECORD_DTYPE_V1.descr + [
+    ("gain", "<f4"),        # filter gain for this sample, warm-up boost included
+    ("bias", "<f4", (6,)),  # accel offset + gyro bias, raw counts the filter subtracts from raw
+])
+# record size in the header -> dtype
+RECORD_DTYPES = {dtype.itemsize: dtype for dtype in (RECORD_DTYPE_V1, RECORD_DTYPE)}
+
+FLUSH_INTERVAL = 1.0    # seconds of data a crash can lose at most
+
+_STOP = object()
+
+
+def session_path(directory, session, part=0):
+    day = time.strftime("%Y%m%d", time.localtime(session))
+    return os.path.join(directory, day + ("-%d.rec" % part if part else ".rec"))
+
+
+def file_header(config, engine="madgwick"):
+    return MAGIC + struct.pack(HEADER_FORMAT, RECORD_DTYPE.itemsize, config.accel_range,
+                               config.gyro_range, config.gyro_divider, engine.encode())
+
+
+# (header size, record size, SensorConfig, engine name) from a session
+# file's header
+def read_header(path):
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    magic = header[:len(MAGIC)]
+    size = HEADER_SIZES.get(magic)
+    if size is None or len(header) < size:
+        raise ValueError("%s is not a session file" % path)
+    if magic == MAGIC:
+        record_size, accel_range, gyro_range, divider, engine = struct.unpack_from(
+            HEADER_FORMAT, header, len(MAGIC))
+        engine = engine.rstrip(b"\0").decode()
+    else:
+        record_size, accel_range, gyro_range, divider = struct.unpack_from(
+            HEADER_FORMAT_V2, header, len(MAGIC))
+        engine = "madgwick"
+    if magic == MAGIC_V1:
+        return size, record_size, DEFAULT_CONFIG, engine
+    # the divider written to the header has always been the gyro's
+    config = SensorConfig(GYRO_BASE_RATE / (1 + divider), accel_range, gyro_range)
+    return size, record_size, config, engine
+
+
+# Open the day's file for appending: the first part that is new or was
+# started with the same header. A record torn by a crash is cut off first,
+# so new records stay aligned.
+def open_session_file(directory, session, config=DEFAULT_CONFIG, engine="madgwick"):
+    header = file_header(config, engine)
+    part = 0
+    while True:
+        path = session_path(directory, session, part)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            f = open(path, "ab")
+            f.write(header)
+            return path, f
+        with open(path, "rb") as f:
+            if f.read(HEADER_SIZE) == header:
+                size = os.path.getsize(path)
+                whole = HEADER_SIZE + (size - HEADER_SIZE) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+                f = open(path, "ab")
+                if whole != size:
+                    f.truncate(whole)
+                return path, f
+        part += 1
+
+
+# Writer thread: the fusion loop hands over chunks with write(), which only
+# queues them. Records are built, batched and appended here, and flushed to
+# disk (fsync) every FLUSH_INTERVAL. config is the sensor setup the raw
+# counts come from and engine the fusion engine's name, both kept in the
+# file header for replay.
+class SessionRecorder(threading.Thread):
+    def __init__(self, directory="sessions", flush_interval=FLUSH_INTERVAL, config=DEFAULT_CONFIG,
+                 engine="madgwick"):
+        super().__init__(daemon=True)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.config = config
+        self.engine = engine
+        self.queue = queue.SimpleQueue()
+        self.files = {}
+        self.records = 0
+        self.flushes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    # samples: (n, 7) t + raw counts from the ring buffer; quats: n
+    # quaternions; gains: n filter gains; bias: the 6 offsets from raw
+    def write(self, session, t0, samples, quats, gains, bias):
+        self.queue.put((session, t0, samples, quats, gains, bias))
+
+    def run(self):
+        pending = []
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                self.flush(pending)
+                break
+            if item is not None:
+                pending.append(self.to_records(*item))
+            if time.monotonic() >= next_flush:
+                self.flush(pending)
+                pending = []
+                next_flush = time.monotonic() + self.flush_interval
+        for f in self.files.values():
+            f.close()
+
+    def to_records(self, session, t0, samples, quats, gains, bias):
+        rec = np.empty(len(samples), RECORD_DTYPE)
+        rec["session"] = session
+        rec["t"] = samples[:, 0] - t0
+        rec["raw"] = samples[:, 1:7]
+        rec["q"] = quats
+        rec["gain"] = gains
+        rec["bias"] = bias
+        return session, rec
+
+    def flush(self, pending):
+        if not pending:
+            return
+        path = None
+        for session, rec in pending:
+            #keyed by the day's first file name, whichever part is open
+            path = session_path(self.directory, session)
+            f = self.files.get(path)
+            if f is None:
+                f = self.files[path] = open_session_file(self.directory, session, self.config,
+                                                             self.engine)[1]
+            f.write(rec.tobytes())
+            self.records += len(rec)
+        for old_path, f in list(self.files.items()):
+            f.flush()
+            os.fsync(f.fileno())
+            # an earlier day's file is finished
+            if old_path != path:
+                f.close()
+                del self.files[old_path]
+        self.flushes += 1
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.join(timeout=5.0)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# Offline reprocessing of recorded sessions (see recorder.py): memory-maps the
+# .rec files and re-runs the main.py pipeline (unit conversion, Madgwick or
+# complementary gravity removal, determine_motion, psuedorandom) over whole
+# arrays.
+import argparse
+import csv
+import datetime
+import glob
+import os
+import sys
+import time
+import numpy as np
+
+from recorder import RECORD_DTYPES, HEADER_SIZE, read_header
+from fusion import (G_TO_MS2, madgwick_batch, complementary_batch, gravity_from_quaternions,
+                    sample_periods)
+from sensor_config import DEFAULT_CONFIG
+from fusion_engines import ENGINES, make_kernel
+from motion import FEATURE_AXES, motion_features, wheel_frame, psuedorandom, dimension
+
+
+# Memory-map a session file as a record array; a torn last record is dropped.
+# Returns the records, the SensorConfig they were recorded with and the name
+# of the fusion engine that ran.
+def load_records(path):
+    size = os.path.getsize(path)
+    header_size, record_size, config, engine = read_header(path)
+    dtype = RECORD_DTYPES.get(record_size)
+    if dtype is None:
+        raise ValueError("%s has unknown %d-byte records" % (path, record_size))
+    count = (size - header_size) // dtype.itemsize
+    if count <= 0:
+        return np.zeros(0, dtype), config, engine
+    records = np.memmap(path, dtype=dtype, mode="r", offset=header_size, shape=(count,))
+    return records, config, engine
+
+
+# Split a record array into per-session views (sessions are contiguous)
+def split_sessions(records):
+    if not len(records):
+        return []
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(records["session"])) + 1, [len(records)]))
+    return [records[a:b] for a, b in zip(starts[:-1], starts[1:])]
+
+
+# YYYYMMDD.rec before YYYYMMDD-1.rec, -2, ...
+def file_order(path):
+    name, _, part = os.path.basename(path)[:-len(".rec")].partition("-")
+    return name, int(part) if part.isdigit() else 0
+
+
+# Session files under the given paths whose day falls inside [since, until].
+# Paths that don't exist are reported on stderr and skipped.
+def session_files(paths, since=None, until=None):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.rec")), key=file_order))
+        elif os.path.exists(path):
+            files.append(path)
+        else:
+            print("%s: no such file or directory, skipped" % path, file=sys.stderr)
+    selected = []
+    for path in files:
+        try:
+            day = datetime.datetime.strptime(os.path.basename(path)[:8], "%Y%m%d").date()
+        except ValueError:
+            day = None
+        if day is not None and ((since and day < since) or (until and day > until)):
+            continue
+        selected.append(path)
+    return selected
+
+
+# The given fusion kernel over samples 1.. of a session, from the
+# orientation recorded after sample 0, one update() per sample at the given
+# per-sample gains. Returns (N-1, 3) linear acceleration.
+def rerun_kernel(kernel, counts, dt, gains):
+    kernel.boost = 0.0
+    lins = []
+    for row, h, gain in zip(counts[1:].tolist(), dt[1:].tolist(), gains[1:].tolist()):
+        kernel.gain = gain
+        lins.append(kernel.update(*row, h))
+    return np.array(lins).reshape(-1, 3)
+
+
+# Re-run the pipeline over one session. The recorded quaternion is the
+# orientation after each sample, so the filter carries on from the first one
+# over the rest of the session and sessions reprocess independently.
+# engine None re-runs the engine that was live (`recorded`, from the file
+# header); "madgwick" runs Madgwick whatever was live; "complementary" is the
+# vectorized complementary filter, from the first sample's tilt. gain None
+# uses the gains recorded per sample (warm-up included) when re-running the
+# live engine, otherwise that engine's default gain; the recorded
+# calibration offsets are subtracted as the live filter did. config is the
+# sensor setup from the file header (see load_records).
+def reprocess(session, gain=None, engine=None, config=DEFAULT_CONFIG, recorded="madgwick"):
+    raw = np.asarray(session["raw"], dtype=float)
+    dt = sample_periods(session["t"])
+    has_inputs = "bias" in session.dtype.names
+    counts = raw - session["bias"] if has_inputs else raw
+    if engine == "complementary":
+        _, lin = complementary_batch(counts, dt, config=config)
+    else:
+        engine = engine or recorded
+        if gain is None:
+            gain = session["gain"] if has_inputs and engine == recorded else ENGINES[engine].DEFAULT_GAIN
+        gain = np.broadcast_to(np.asarray(gain, dtype=float), (len(raw),))
+        q0 = np.asarray(session["q"][:1], dtype=float)
+        if engine == "madgwick":
+            _, lin_rest = madgwick_batch(counts[1:], dt[1:], q0[0], gain[1:], config)
+        else:
+            lin_rest = rerun_kernel(make_kernel(engine, q=q0[0], config=config), counts, dt, gain)
+        lin0 = counts[:1, :3] * (G_TO_MS2 / config.lsb_per_g) - gravity_from_quaternions(q0) * G_TO_MS2
+        lin = np.concatenate((lin0, lin_rest))
+
+    #wheel frame: x/y swap for both accel and gyro
+    motion = wheel_frame(lin, raw[:, 3:] / config.lsb_per_rps)
+    features = motion_features(motion, dt)
+
+    averages = features["averages"]
+    dominant_motion = averages.index(max(averages))
+    last = tuple(motion[-1].tolist())
+    direction, rotations, runtime = psuedorandom(last)
+    return {
+        "session": int(session["session"][0]),
+        "samples": len(session),
+        "duration": float(session["t"][-1]),
+        "dominant_motion": dominant_motion,
+        "dimension": dimension(dominant_motion),
+        "direction": "CW" if direction == 0 else "CCW",
+        "rotations": rotations,
+        "runtime": runtime,
+        "averages": averages,
+        "features": features,
+    }
+
+
+FEATURE_COLUMNS = (["%s_%s" % (axis, name) for name in ("rms", "peak", "energy", "crossings")
+                    for axis in FEATURE_AXES] + ["xr_angle", "yr_angle", "zr_angle"])
+
+
+def feature_row(features):
+    row = []
+    for name in ("rms", "peak", "energy"):
+        row += ["%.5f" % v for v in features[name]]
+    row += [int(v) for v in features["crossings"]]
+    return row + ["%.5f" % v for v in features["angle"]]
+
+
+def parse_date(text):
+    return datetime.datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess recorded wheel sessions")
+    parser.add_argument("paths", nargs="*", default=["sessions"], help="session files or directories")
+    parser.add_argument("--since", type=parse_date, help="first day, YYYY-MM-DD")
+    parser.add_argument("--until", type=parse_date, help="last day, YYYY-MM-DD")
+    parser.add_argument("--first-session", type=int, help="lowest session id (unix time)")
+    parser.add_argument("--last-session", type=int, help="highest session id (unix time)")
+    parser.add_argument("--gain", type=float,
+                        help="fixed filter gain (default: as recorded, or the engine's default)")
+    parser.add_argument("--filter", choices=["recorded", "madgwick", "complementary"], default="recorded",
+                        help="gravity removal: the engine that ran live, Madgwick, or the batch complementary filter")
+    parser.add_argument("--features", action="store_true",
+                        help="add rms, peak, energy and zero-crossing columns per axis and rotation angles")
+    parser.add_argument("--csv", help="write per-session results here instead of stdout")
+    args = parser.parse_args()
+
+    out = open(args.csv, "w", newline="") if args.csv else sys.stdout
+    writer = csv.writer(out)
+    writer.writerow([
+        "session", "start", "samples", "duration",
+        "x_avg", "y_neg_avg", "y_pos_avg", "z_neg_avg", "z_pos_avg",
+        "xr_avg", "yr_avg", "zr_avg",
+        "dominant_motion", "dimension", "direction", "rotations", "runtime",
+    ] + (FEATURE_COLUMNS if args.features else []))
+
+    start = time.perf_counter()
+    sessions = samples = 0
+    for path in session_files(args.paths, args.since, args.until):
+        records, config, recorded = load_records(path)
+        ids = records["session"]
+        keep = np.ones(len(records), dtype=bool)
+        if args.first_session is not None:
+            keep &= ids >= args.first_session
+        if args.last_session is not None:
+            keep &= ids <= args.last_session
+        if args.since:
+            keep &= ids >= time.mktime(args.since.timetuple())
+        if args.until:
+            keep &= ids < time.mktime((args.until + datetime.timedelta(days=1)).timetuple())
+        if not keep.all():
+            records = records[keep]
+
+        for session in split_sessions(records):
+            engine = None if args.filter == "recorded" else args.filter
+            r = reprocess(session, args.gain, engine, config, recorded)
+            writer.writerow([
+                r["session"], time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["session"])),
+                r["samples"], "%.2f" % r["duration"],
+                *("%.5f" % a for a in r["averages"]),
+                r["dominant_motion"], r["dimension"], r["direction"], r["rotations"], r["runtime"],
+            ] + (feature_row(r["features"]) if args.features else []))
+            sessions += 1
+            samples += r["samples"]
+
+    if args.csv:
+        out.close()
+    elapsed = time.perf_counter() - start
+    print("reprocessed %d sessions, %d samples in %.2f s" % (sessions, samples, elapsed), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
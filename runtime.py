@@ -0,0 +1,315 @@
+import asyncio
+import time
+import numpy as np
+from motion import MotionClassifier, dimension, psuedorandom
+from audio import MUSIC
+from hal import RealClock
+from latency import StageTimer
+from calibration import sensor_key, sensor_temperature
+from motion_plans import PlanCache, SPIN_PAUSE, cruise_rps
+
+BUTTON_PIN = 24         # input to start/stop recording
+BOUNCE_MS = 20
+FUSION_INTERVAL = 0.01  # how often fusion drains the ring buffer while recording
+INIT_SAMPLES = 10       # accel samples averaged to initialize the filter
+INIT_HOLD = 0.2         # seconds of samples captured at rest to initialize it
+IDLE_POLL = 0.1         # how soon after a spin the filter is initialized again
+IDLE_CALIBRATION_INTERVAL = 60.0   # seconds idle between recalibration captures
+IDLE_CALIBRATION_HOLD = 2.0        # seconds of samples per capture
+
+
+# Event-driven wheel: the button is an edge event, a session task records and
+# decides, a motor task runs queued spins. Stepping runs in a worker thread so
+# the event loop (and the next recording) stays live during a spin.
+# Hardware comes in as backends (see hal.py), so the same runtime drives the
+# Pi or a simulation.
+class WheelRuntime:
+    def __init__(self, gpio, acq, imu_buffer, kernel, stepper, audio_engine, clock=None, log=print,
+                 recorder=None, bus=None, calibrator=None, calibration_store=None, plans=None,
+                 early_confidence=None):
+        self.gpio = gpio
+        self.acq = acq
+        self.imu_buffer = imu_buffer
+        self.kernel = kernel
+        self.stepper = stepper
+        self.audio_engine = audio_engine
+        self.clock = clock or RealClock()
+        self.log = log
+        self.recorder = recorder
+        self.bus = bus
+        self.calibrator = calibrator
+        self.calibration_store = calibration_store
+        self.plans = plans if plans is not None else PlanCache(audio_engine)
+        #stop recording and spin as soon as the dominant motion is this certain (None: at release)
+        self.early_confidence = early_confidence
+        self.motion_stats = MotionClassifier()
+        self.count = 0
+        self.last_t = None
+        self.session = 0
+        self.session_t0 = None
+        self.init_samples = []
+        #per-sample fusion cost: Madgwick kernel (units + filter + gravity) and motion stats
+        self.timing = StageTimer("fusion", "stats")
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.pressed = asyncio.Event()
+        self.released = asyncio.Event()
+        self.spins = asyncio.Queue()
+        self.spinning = False
+        self.gpio.add_event_detect(BUTTON_PIN, self.gpio.BOTH, callback=self.on_edge,
+                                   bouncetime=BOUNCE_MS)
+        try:
+            await asyncio.gather(self.session_task(), self.motor_task())
+        finally:
+            self.gpio.remove_event_detect(BUTTON_PIN)
+
+    # GPIO callback thread -> event loop
+    def on_edge(self, channel):
+        level = self.gpio.input(channel)
+        self.loop.call_soon_threadsafe(self.edge, level)
+
+    def edge(self, level):
+        if level == 1:
+            self.released.clear()
+            self.pressed.set()
+        else:
+            self.released.set()
+
+    async def session_task(self):
+        while True:
+            await self.idle()
+            await self.pressed.wait()
+            self.pressed.clear()
+            if self.released.is_set():
+                continue
+
+            self.begin_session()
+
+            while not self.released.is_set():
+                self.fuse(self.imu_buffer.read())
+                if self.decided_early():
+                    break
+                try:
+                    await asyncio.wait_for(self.released.wait(), FUSION_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+            job = self.end_session()
+            if job is not None:
+                if self.busy():
+                    self.log('wheel busy, spin queued')
+                self.spins.put_nowait(job)
+
+    # A spin is running or queued
+    def busy(self):
+        return self.spinning or not self.spins.empty()
+
+    # While nobody is at the wheel: once it has stopped, start the filter from
+    # the orientation gravity gives at rest (the spin leaves it reset), so the
+    # next session begins already converged; with a calibrator, also capture
+    # a stretch every IDLE_CALIBRATION_INTERVAL and refine the gyro bias /
+    # accel offset from it. Returns as soon as the button is pressed.
+    async def idle(self):
+        calibrate_at = self.clock.now() + IDLE_CALIBRATION_INTERVAL
+        while not self.pressed.is_set():
+            if not self.kernel.initialized and not self.busy():
+                samples = await self.capture(INIT_HOLD)
+                if samples is not None:
+                    self.settle(samples)
+            elif self.calibrator is not None and self.clock.now() >= calibrate_at and not self.busy():
+                calibrate_at = self.clock.now() + IDLE_CALIBRATION_INTERVAL
+                samples = await self.capture(IDLE_CALIBRATION_HOLD)
+                if samples is not None:
+                    self.recalibrate(samples)
+            try:
+                await asyncio.wait_for(self.pressed.wait(), IDLE_POLL)
+            except asyncio.TimeoutError:
+                pass
+
+    # Record `seconds` of samples between sessions; None if the button was
+    # pressed or a spin started meanwhile
+    async def capture(self, seconds):
+        self.acq.start_recording()
+        try:
+            await asyncio.wait_for(self.pressed.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        self.acq.stop_recording()
+        samples = self.imu_buffer.read()
+        if self.pressed.is_set() or self.busy():
+            return None
+        return samples
+
+    # Initialize the filter from samples taken at rest. Returns False (and
+    # leaves it to the next try, or the session) if there are too few or, with
+    # a calibrator to tell, the wheel was moving.
+    def settle(self, samples):
+        if len(samples) < INIT_SAMPLES:
+            return False
+        if self.calibrator is not None and not self.calibrator.stationary(samples[:, 1:]):
+            return False
+        self.kernel.initialize(*samples[:, 1:4].mean(axis=0))
+        return True
+
+    def recalibrate(self, samples):
+        imu = self.acq.imu
+        if not self.calibrator.feed(samples[:, 1:], sensor_temperature(imu)):
+            return False
+        cal = self.calibrator.calibration
+        self.kernel.set_bias(cal["gyro_bias"], cal["accel_offset"])
+        if self.calibration_store is not None:
+            self.calibration_store.save(sensor_key(imu), cal)
+        self.log('recalibrated: gyro bias %s, accel offset %s'
+                 % (['%.1f' % v for v in cal['gyro_bias']], ['%.1f' % v for v in cal['accel_offset']]))
+        return True
+
+    def begin_session(self):
+        self.acq.start_recording()
+        self.motion_stats.reset()
+        self.count = 0
+        self.last_t = None
+        #unix-time session id, kept unique if sessions start within a second
+        self.session = max(int(time.time()), self.session + 1)
+        self.session_t0 = None
+        self.init_samples = []
+        self.timing.reset()
+        self.log('recording...')
+
+    # True once the classifier is confident enough to end the session before
+    # the button is released
+    def decided_early(self):
+        if self.early_confidence is None:
+            return False
+        if self.motion_stats.check(self.early_confidence) is None:
+            return False
+        self.log('decided early after %d samples' % self.motion_stats.decided_at)
+        return True
+
+    # Button released (or an early decision): fuse what is left and decide. Returns the spin job, or
+    # None if nothing was recorded.
+    def end_session(self):
+        self.acq.stop_recording()
+        self.fuse(self.imu_buffer.read())
+        if self.count == 0:
+            return None
+
+        acq_stats = self.acq.stats()
+        self.log('samples:', acq_stats['samples'], 'overruns:', acq_stats['overruns'],
+                 'rate: %.1f Hz' % acq_stats['rate'],
+                 'max gap: %.1f ms' % (acq_stats['max_gap'] * 1000))
+        if 'fifo_overflows' in acq_stats:
+            self.log('fifo overflows:', acq_stats['fifo_overflows'])
+        for line in self.acq.timing.summary() + self.timing.summary():
+            self.log('  ' + line)
+        return self.decide()
+
+    def fuse(self, samples):
+        if not len(samples):
+            return
+        kernel = self.kernel
+        if not kernel.initialized:
+            #not settled before the press: hold samples back until there are
+            #INIT_SAMPLES to start from, rather than the identity
+            self.init_samples.append(samples)
+            samples = np.concatenate(self.init_samples)
+            if len(samples) < INIT_SAMPLES:
+                return
+            self.init_samples = []
+            kernel.initialize(*samples[:INIT_SAMPLES, 1:4].mean(axis=0))
+        q = kernel.q
+        motion_stats = self.motion_stats
+        last_t = self.last_t
+        fusion_timing = self.timing["fusion"]
+        stats_timing = self.timing["stats"]
+        gyr_scale = kernel.gyr_scale
+        perf = time.perf_counter
+        bus = self.bus
+        quats = [] if self.recorder is not None or bus is not None else None
+        lins = [] if bus is not None else None
+        gains = [] if self.recorder is not None else None
+        for t, ax_raw, ay_raw, az_raw, gx_raw, gy_raw, gz_raw in samples.tolist():
+            #Madgwick sample period from the sample timestamps
+            dt = t - last_t if last_t is not None and t > last_t else 1e-3
+            last_t = t
+
+            if gains is not None:
+                gains.append(kernel.gain + kernel.boost)
+
+            #units -> Madgwick -> gravity removal in one scalar update
+            t0 = perf()
+            lx, ly, lz = kernel.update(ax_raw, ay_raw, az_raw, gx_raw, gy_raw, gz_raw, dt)
+            t1 = perf()
+
+            #wheel frame: x/y swap for both accel and gyro
+            motion_stats.update(ly, lx, lz, gy_raw * gyr_scale, gx_raw * gyr_scale, gz_raw * gyr_scale)
+            fusion_timing.add(t1 - t0)
+            stats_timing.add(perf() - t1)
+            if quats is not None:
+                quats.append((q[0], q[1], q[2], q[3]))
+                if lins is not None:
+                    lins.append((lx, ly, lz))
+        self.count += len(samples)
+        self.last_t = last_t
+
+        #fused samples to other processes through shared memory
+        if bus is not None:
+            bus.publish(samples, quats, lins)
+
+        #raw samples, quaternions and what replay needs to re-run the filter
+        #go to the session log on its own thread
+        if self.recorder is not None:
+            if self.session_t0 is None:
+                self.session_t0 = samples[0, 0]
+            bias = (kernel.ax_off, kernel.ay_off, kernel.az_off, kernel.gx_bias, kernel.gy_bias, kernel.gz_bias)
+            self.recorder.write(self.session, self.session_t0, samples, quats, gains, bias)
+
+    def decide(self):
+        result = psuedorandom(self.motion_stats.last)
+
+        #Make sure the dominant motion gives its dimension
+        dominant_motion, averages = self.motion_stats.determine_motion()
+        if self.motion_stats.decided is not None:
+            #an early decision stands; samples fused after it don't change the spin
+            dominant_motion = self.motion_stats.decided
+        self.log("Averages:", averages)
+
+        #print results
+        self.log('dimension:', dimension(dominant_motion))
+        if result[0] == 0:
+            self.log('direction: Clockwise')
+        else:
+            self.log('direction: Counter-Clockwise')
+        self.log('rotations =', result[1])
+        self.log('speed =', cruise_rps(result[2], self.plans.max_rps), 'rps')
+
+        return (result[0], result[1], dimension(dominant_motion), result[2])
+
+    async def motor_task(self):
+        while True:
+            job = await self.spins.get()
+            self.spinning = True
+            try:
+                await self.spin(*job)
+            finally:
+                self.spinning = False
+                #the wheel moved without being tracked; idle() re-initializes it at rest
+                self.kernel.reset()
+
+    async def spin(self, direction, rotations, dimension, runtime):
+        #every outcome is planned at startup; this is a table lookup
+        plan = self.plans.get(direction, rotations, dimension, runtime)
+
+        self.audio_engine.play(MUSIC)
+
+        #ramped main rotation, cruising at the runtime's speed (cruise_rps)
+        timing = await asyncio.to_thread(self.stepper.run, plan.waveform, plan.times)
+        self.log('actual speed = %.3f rps over %.2f s (max step lateness %.2f ms)'
+                 % (timing['actual_rps'], timing['elapsed'], timing['max_late'] * 1000))
+
+        self.audio_engine.play(plan.sound)
+
+        await self.clock.async_sleep(SPIN_PAUSE)
+
+        #ramped return to the arrow
+        await asyncio.to_thread(self.stepper.run, plan.home_waveform, plan.home_times)
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# Shared-memory sample bus: the fused samples of the running session in a ring
+# that other processes attach to by name, with no pickling or pipes.
+# Run as a script to attach to a live bus and print telemetry.
+import argparse
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+from acquisition import T, GZ
+
+# Row layout: acquisition's timestamp + raw counts, then the Madgwick
+# quaternion and linear acceleration (m/s^2) after that sample
+BUS_COLS = 14
+QW, QX, QY, QZ = range(7, 11)
+LX, LY, LZ = range(11, 14)
+
+BUS_MAGIC = 0x5748_4C42_5553_0002     # "WHLBUS", version 2
+# int64 header words
+H_MAGIC, H_CAPACITY, H_COLS, H_HEAD, H_WRITE = range(5)
+HEADER_WORDS = 8
+
+
+def _attach(name):
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name, track=False)
+    # before 3.13 an attaching process registers the block with its resource
+    # tracker, which would unlink it from under the writer on exit. A child of
+    # the writer shares its tracker, so it should use the writer's SampleBus
+    # rather than attach by name.
+    from multiprocessing import resource_tracker
+    shm = shared_memory.SharedMemory(name)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+# Ring of BUS_COLS float64 rows in one shared-memory block. One process
+# writes; any number attach and read through a BusReader. The header works as
+# a seqlock: before copying a block the writer stores the sequence number it
+# is writing up to in the write word, and only after the copy does it store
+# the head word (the sequence number of the next row). Readers take rows below
+# head and, once they have used them, check they are further back than the
+# write word minus capacity, so a copy that overlapped a write is retried.
+class SampleBus:
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        if self.header[H_MAGIC] != BUS_MAGIC or self.header[H_COLS] != BUS_COLS:
+            raise ValueError("%s is not a sample bus" % shm.name)
+        self.capacity = int(self.header[H_CAPACITY])
+        self.data = np.ndarray((self.capacity, BUS_COLS), dtype=np.float64,
+                               buffer=shm.buf, offset=HEADER_WORDS * 8)
+
+    @classmethod
+    def create(cls, name=None, capacity=8192):
+        size = HEADER_WORDS * 8 + capacity * BUS_COLS * 8
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_CAPACITY] = capacity
+        header[H_COLS] = BUS_COLS
+        header[H_MAGIC] = BUS_MAGIC
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach(name), owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def head(self):
+        return int(self.header[H_HEAD])
+
+    # Rows before this sequence number minus capacity are safe from the writer
+    @property
+    def write_seq(self):
+        return int(self.header[H_WRITE])
+
+    # Writer side: publish an (n, BUS_COLS) block of rows
+    def write_block(self, rows):
+        n = len(rows)
+        if n == 0:
+            return
+        head = int(self.header[H_HEAD])
+        if n > self.capacity:
+            rows = rows[-self.capacity:]
+            head += n - self.capacity
+            n = self.capacity
+        self.header[H_WRITE] = head + n
+        start = head % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        if first < n:
+            self.data[:n - first] = rows[first:]
+        self.header[H_HEAD] = head + n
+
+    # Writer side: samples (n, 7) from the ring buffer plus n quaternions and
+    # n linear accelerations
+    def publish(self, samples, quats, lin):
+        rows = np.empty((len(samples), BUS_COLS))
+        rows[:, T:GZ + 1] = samples
+        rows[:, QW:QZ + 1] = quats
+        rows[:, LX:LZ + 1] = lin
+        self.write_block(rows)
+
+    def close(self):
+        self.header = self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# One consumer's position on the bus. read() hands back views into shared
+# memory (a copy only when the range wraps around the end of the ring); they
+# stay valid until the writer laps them, which intact() checks after use.
+class BusReader:
+    def __init__(self, bus, from_start=False):
+        self.bus = bus
+        self.cursor = max(0, bus.head - bus.capacity) if from_start else bus.head
+        self.dropped = 0
+
+    # Returns (seq, rows): rows are sequence numbers seq.. of every row
+    # published since the last read, up to max_rows
+    def read(self, max_rows=None):
+        bus = self.bus
+        head = bus.head
+        oldest = bus.write_seq - bus.capacity
+        if self.cursor < oldest:
+            # fell more than a ring behind
+            self.dropped += oldest - self.cursor
+            self.cursor = oldest
+        seq = self.cursor
+        n = head - seq
+        if max_rows is not None:
+            n = min(n, max_rows)
+        start = seq % bus.capacity
+        if start + n <= bus.capacity:
+            rows = bus.data[start:start + n]
+        else:
+            rows = np.concatenate((bus.data[start:], bus.data[:start + n - bus.capacity]))
+        self.cursor = seq + n
+        return seq, rows
+
+    # True if rows from sequence number seq on have not been overwritten yet,
+    # or started to be
+    def intact(self, seq):
+        return seq >= self.bus.write_seq - self.bus.capacity
+
+    # The newest n rows as a copy, for telemetry snapshots
+    def latest(self, n=1):
+        bus = self.bus
+        while True:
+            head = bus.head
+            n = min(n, head, bus.capacity)
+            idx = np.arange(head - n, head) % bus.capacity
+            rows = bus.data[idx]
+            if self.intact(head - n):
+                return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print telemetry from a live sample bus")
+    parser.add_argument("name", help="shared-memory name the wheel was started with (main.py --bus)")
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between lines")
+    args = parser.parse_args()
+
+    bus = SampleBus.attach(args.name)
+    reader = BusReader(bus)
+    try:
+        while True:
+            time.sleep(args.interval)
+            seq, rows = reader.read()
+            if not len(rows):
+                print("seq %d  idle" % seq)
+                continue
+            lin = rows[:, LX:LZ + 1]
+            rms = np.sqrt((lin * lin).mean(axis=0))
+            last = rows[-1].copy()
+            if not reader.intact(seq):
+                print("reader lapped; skipping")
+                continue
+            print("seq %d  %4d rows  %6.1f Hz  lin rms %.2f %.2f %.2f m/s^2  q %.3f %.3f %.3f %.3f  dropped %d"
+                  % (seq, len(rows), len(rows) / args.interval, rms[0], rms[1], rms[2],
+                     last[QW], last[QX], last[QY], last[QZ], reader.dropped))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bus.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import math
+
+# ICM-20948 user bank 2 registers (datasheet DS-000189, section 10)
+REG_BANK_SEL = 0x7F
+GYRO_SMPLRT_DIV = 0x00
+GYRO_CONFIG_1 = 0x01        # [5:3] DLPFCFG, [2:1] FS_SEL, [0] FCHOICE
+ACCEL_SMPLRT_DIV_1 = 0x10   # divider bits 11:8
+ACCEL_SMPLRT_DIV_2 = 0x11   # divider bits 7:0
+ACCEL_CONFIG = 0x14         # [5:3] DLPFCFG, [2:1] FS_SEL, [0] FCHOICE
+
+# With the DLPF on, the gyro runs at 1.1 kHz / (1 + GYRO_SMPLRT_DIV) and the
+# accelerometer at 1.125 kHz / (1 + ACCEL_SMPLRT_DIV)
+GYRO_BASE_RATE = 1100.0
+ACCEL_BASE_RATE = 1125.0
+
+# full scale -> (FS_SEL, sensitivity): LSB/g for accel, LSB/(deg/s) for gyro
+ACCEL_RANGES = {2: (0, 16384.0), 4: (1, 8192.0), 8: (2, 4096.0), 16: (3, 2048.0)}
+GYRO_RANGES = {250: (0, 131.0), 500: (1, 65.5), 1000: (2, 32.8), 2000: (3, 16.4)}
+
+# DLPFCFG -> 3 dB bandwidth in Hz
+ACCEL_DLPF = {0: 246.0, 2: 111.4, 3: 50.4, 4: 23.9, 5: 11.5, 6: 5.7, 7: 473.0}
+GYRO_DLPF = {0: 196.6, 1: 151.8, 2: 119.5, 3: 51.2, 4: 23.9, 5: 11.6, 6: 5.7, 7: 361.4}
+
+
+def nearest_dlpf(table, bandwidth):
+    return min(table, key=lambda cfg: abs(table[cfg] - bandwidth))
+
+
+# Sampling setup of the IMU: output data rate, low-pass bandwidth and full-scale
+# ranges. The raw-count scale factors used by fusion follow from the ranges,
+# and acquisition paces itself to the rate the sensor actually runs at.
+class SensorConfig:
+    def __init__(self, rate=100.0, accel_range=2, gyro_range=1000, accel_dlpf=50.0, gyro_dlpf=51.0):
+        if accel_range not in ACCEL_RANGES:
+            raise ValueError("accel range must be one of %s g" % sorted(ACCEL_RANGES))
+        if gyro_range not in GYRO_RANGES:
+            raise ValueError("gyro range must be one of %s dps" % sorted(GYRO_RANGES))
+        if not 0 < rate <= GYRO_BASE_RATE:
+            raise ValueError("rate must be in (0, %g] Hz" % GYRO_BASE_RATE)
+        self.accel_range = accel_range
+        self.gyro_range = gyro_range
+        self.accel_dlpf_cfg = nearest_dlpf(ACCEL_DLPF, accel_dlpf)
+        self.gyro_dlpf_cfg = nearest_dlpf(GYRO_DLPF, gyro_dlpf)
+        # gyro divider is 8 bits, accel 12. The gyro sets the rate and the
+        # accel divider is the one that comes closest to it
+        self.gyro_divider = min(255, max(0, int(round(GYRO_BASE_RATE / rate)) - 1))
+        self.accel_divider = min(4095, max(0, int(round(ACCEL_BASE_RATE / self.rate)) - 1))
+
+    @property
+    def rate(self):
+        return GYRO_BASE_RATE / (1 + self.gyro_divider)
+
+    @property
+    def accel_rate(self):
+        return ACCEL_BASE_RATE / (1 + self.accel_divider)
+
+    @property
+    def period(self):
+        return 1.0 / self.rate
+
+    @property
+    def lsb_per_g(self):
+        return ACCEL_RANGES[self.accel_range][1]
+
+    # LSB per rad/s, so raw / lsb_per_rps is rad/s
+    @property
+    def lsb_per_rps(self):
+        return GYRO_RANGES[self.gyro_range][1] * 180 / math.pi
+
+    @property
+    def accel_dlpf(self):
+        return ACCEL_DLPF[self.accel_dlpf_cfg]
+
+    @property
+    def gyro_dlpf(self):
+        return GYRO_DLPF[self.gyro_dlpf_cfg]
+
+    # Program the sensor through the qwiic driver's I2C handle. Call after
+    # imu.begin(), which sets its own defaults.
+    def apply(self, imu):
+        i2c = imu._i2c
+        address = imu.address
+        gyro_config = (self.gyro_dlpf_cfg << 3) | (GYRO_RANGES[self.gyro_range][0] << 1) | 1
+        accel_config = (self.accel_dlpf_cfg << 3) | (ACCEL_RANGES[self.accel_range][0] << 1) | 1
+        i2c.writeByte(address, REG_BANK_SEL, 2 << 4)
+        i2c.writeByte(address, GYRO_SMPLRT_DIV, self.gyro_divider)
+        i2c.writeByte(address, GYRO_CONFIG_1, gyro_config)
+        i2c.writeByte(address, ACCEL_SMPLRT_DIV_1, self.accel_divider >> 8)
+        i2c.writeByte(address, ACCEL_SMPLRT_DIV_2, self.accel_divider & 0xFF)
+        i2c.writeByte(address, ACCEL_CONFIG, accel_config)
+        i2c.writeByte(address, REG_BANK_SEL, 0)
+
+    def describe(self):
+        return "%.1f Hz, accel +-%d g (%.1f Hz, DLPF %.1f Hz), gyro +-%d dps (DLPF %.1f Hz)" % (
+            self.rate, self.accel_range, self.accel_rate, self.accel_dlpf, self.gyro_range,
+            self.gyro_dlpf)
+
+
+# What the constants in fusion.py used to hard-code: +-2 g, +-1000 dps
+DEFAULT_CONFIG = SensorConfig()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# Run full wheel sessions (press, hold, release, decide, spin) on simulated
+# hardware and a virtual clock, faster than real time, and report throughput
+# and latency of the pipeline.
+import argparse
+import asyncio
+import time
+import numpy as np
+
+from hal import SimClock, SimGPIO, SimIMU, SimMixer, synthetic_trace
+from acquisition import RingBuffer, AcquisitionThread
+from fusion import FusionKernel
+from audio import AudioEngine
+from stepper import StepScheduler
+from runtime import WheelRuntime, FUSION_INTERVAL, INIT_HOLD
+
+PINS = [23, 22, 17, 27]
+
+
+def build_wheel(trace, rate=100.0, clock=None, log=None, early_confidence=None):
+    clock = clock or SimClock()
+    gpio = SimGPIO()
+    imu = SimIMU(trace, rate, clock)
+    imu_buffer = RingBuffer()
+    acq = AcquisitionThread(imu, imu_buffer, clock=clock)
+    return WheelRuntime(gpio, acq, imu_buffer, FusionKernel(), StepScheduler(gpio, PINS, clock),
+                        AudioEngine(SimMixer()), clock=clock, log=log or (lambda *args: None),
+                        early_confidence=early_confidence)
+
+
+# Record `seconds` of samples on the virtual clock outside a session, as
+# WheelRuntime.capture does while idle
+def capture(wheel, seconds):
+    clock = wheel.clock
+    acq = wheel.acq
+    imu = acq.imu
+    imu.next_t = clock.now()
+    end = clock.now() + seconds
+    acq.start_recording()
+    while imu.next_t < end:
+        clock.wait_until(imu.next_t)
+        acq.poll_once()
+    clock.wait_until(end)
+    acq.stop_recording()
+    return wheel.imu_buffer.read()
+
+
+# One session on the virtual clock. The acquisition thread isn't started;
+# its poll is called directly as each simulated sample comes due, and fusion
+# drains the ring buffer every FUSION_INTERVAL of simulated time like the
+# session task does, stopping early if the wheel decides before release.
+# Like the runtime, the filter is initialized from an idle capture before
+# the press and reset after the spin.
+# This drives the session steps (begin_session, fuse, decided_early,
+# end_session, spin) itself rather than WheelRuntime.run(), whose waits are
+# asyncio timeouts on real time. So the event-loop path isn't covered: button
+# edges and debounce, presses that end before the session starts, idle()'s
+# polling and recalibration, and spins queued behind a running one.
+# Returns the spin job, wall-clock seconds spent recording, deciding and
+# spinning, and simulated seconds from press to the start of the spin.
+async def run_session(wheel, hold):
+    clock = wheel.clock
+    acq = wheel.acq
+    imu = acq.imu
+    wall = time.perf_counter
+
+    if not wheel.kernel.initialized:
+        wheel.settle(capture(wheel, INIT_HOLD))
+
+    t0 = wall()
+    imu.next_t = clock.now()
+    wheel.begin_session()
+    pressed = clock.now()
+    end = pressed + hold
+    next_fuse = clock.now() + FUSION_INTERVAL
+    while imu.next_t < end:
+        clock.wait_until(imu.next_t)
+        acq.poll_once()
+        if clock.now() >= next_fuse:
+            wheel.fuse(wheel.imu_buffer.read())
+            next_fuse += FUSION_INTERVAL
+            if wheel.decided_early():
+                break
+    else:
+        clock.wait_until(end)
+
+    t1 = wall()
+    job = wheel.end_session()
+    t2 = wall()
+    to_spin = clock.now() - pressed
+    if job is not None:
+        await wheel.spin(*job)
+        wheel.kernel.reset()
+    t3 = wall()
+    return job, t1 - t0, t2 - t1, t3 - t2, to_spin
+
+
+async def run_sessions(wheel, sessions, hold):
+    results = []
+    for _ in range(sessions):
+        results.append(await run_session(wheel, hold))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated wheel sessions, faster than real time")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--hold", type=float, default=5.0, help="button hold per session (s)")
+    parser.add_argument("--rate", type=float, default=100.0, help="IMU sample rate (Hz)")
+    parser.add_argument("--trace", help=".npy file of (N,6) raw ax, ay, az, gx, gy, gz counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--early", type=float, metavar="CONF",
+                        help="spin once the dominant motion is this certain (e.g. 0.99)")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = np.load(args.trace)
+    else:
+        trace = synthetic_trace(int(60 * args.rate), args.rate, args.seed)
+
+    wheel = build_wheel(trace, args.rate, early_confidence=args.early)
+    start = time.perf_counter()
+    results = asyncio.run(run_sessions(wheel, args.sessions, args.hold))
+    wall = time.perf_counter() - start
+
+    record = np.array([r[1] for r in results])
+    decide = np.array([r[2] for r in results])
+    spin = np.array([r[3] for r in results])
+    to_spin = np.array([r[4] for r in results])
+    samples = to_spin * args.rate
+    dims = {}
+    for job, *_ in results:
+        if job is not None:
+            dims[job[2]] = dims.get(job[2], 0) + 1
+
+    print('sessions: %d in %.2f s wall, %.0f s simulated (%.0fx real time)'
+          % (args.sessions, wall, wheel.clock.now(), wheel.clock.now() / wall))
+    print('record+fuse: %.1f us/sample' % (record.sum() / samples.sum() * 1e6))
+    print('release -> decision: mean %.3f ms, p99 %.3f ms'
+          % (decide.mean() * 1000, np.percentile(decide, 99) * 1000))
+    print('press -> spin (simulated): mean %.2f s, min %.2f s of %.2f s hold'
+          % (to_spin.mean(), to_spin.min(), args.hold))
+    print('spin (wall): mean %.1f ms' % (spin.mean() * 1000))
+    print('dimensions:', dims)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import numpy as np
+from hal import RealClock
+
+STEPS_PER_REV = 200     # 50 * 4 full steps per wheel revolution
+
+# Motion limits for ramped moves
+START_RPS = 0.25        # speed the motor can start/stop at without stalling
+ACCEL_RPS2 = 1.0        # ramp acceleration (rev/s^2)
+HOMING_RPS = 1.0        # cruise speed for the return-to-arrow move
+MAX_RPS = 1.25          # cruise speed of the fastest spin (ramped, so above START_RPS)
+
+#Motor logic
+FSCW = [
+    [1,0,0,1],
+    [1,0,1,0],
+    [0,1,1,0],
+    [0,1,0,1]
+]
+
+FSACW = [
+    [0,1,0,1],
+    [0,1,1,0],
+    [1,0,1,0],
+    [1,0,0,1]
+]
+
+# Precompile a move: one pin-state tuple per step. The tuples are shared
+# between steps, so a move costs one pointer per step.
+def compile_waveform(sequence, steps):
+    states = [tuple(turn) for turn in sequence]
+    n = len(states)
+    return [states[i % n] for i in range(steps)]
+
+
+# Step offsets (s from the start of the move) at a constant period.
+# Returns steps + 1 offsets; the last one is when the move ends.
+def constant_times(steps, period):
+    return [i * period for i in range(steps + 1)]
+
+# Step offsets for a ramped move: leave start_rps, ramp at accel_rps2 up to
+# max_rps, cruise, and ramp back down to start_rps on the last step. Short
+# moves become triangular. With s_curve the ramps follow a smoothstep so the
+# acceleration itself starts and ends at zero; they are stretched so the
+# peak, mid-ramp, is still accel_rps2.
+def plan_move(steps, max_rps, accel_rps2=ACCEL_RPS2, start_rps=START_RPS, s_curve=False):
+    v_max = max_rps * STEPS_PER_REV
+    v0 = min(start_rps * STEPS_PER_REV, v_max)
+    a = accel_rps2 * STEPS_PER_REV
+    if a <= 0:
+        ramp = 0.0
+    elif s_curve:
+        # dv/dt = v dv/dd = v (v_max - v0) 6u(1 - u) / ramp over u = d / ramp
+        dv = v_max - v0
+        ramp = max((v0 + dv * u * u * (3.0 - 2.0 * u)) * 6.0 * u * (1.0 - u)
+                   for u in (i / 256.0 for i in range(257))) * dv / a
+    else:
+        ramp = (v_max * v_max - v0 * v0) / (2 * a)
+
+    times = [0.0] * (steps + 1)
+    t = 0.0
+    for i in range(steps):
+        # distance (in steps) to the nearer end of the move
+        d = min(i + 0.5, steps - i - 0.5)
+        if d >= ramp:
+            v = v_max
+        elif s_curve:
+            u = d / ramp
+            v = v0 + (v_max - v0) * u * u * (3.0 - 2.0 * u)
+        else:
+            v = (v0 * v0 + 2 * a * d) ** 0.5
+        t += 1.0 / v
+        times[i + 1] = t
+    return times
+
+
+# Largest acceleration (rev/s^2) of a move from its step offsets, with speed
+# taken between consecutive steps
+def peak_accel(times):
+    t = np.asarray(times, dtype=float)
+    if len(t) < 3:
+        return 0.0
+    period = np.diff(t)
+    v = 1.0 / period
+    a = np.diff(v) / (0.5 * (period[1:] + period[:-1]))
+    return float(np.abs(a).max()) / STEPS_PER_REV
+
+
+# Fires motor steps against absolute deadlines t0 + times[i], so sleep
+# overshoot and GPIO latency don't accumulate over a move. The clock sleeps
+# until just before each deadline and spins for the rest.
+class StepScheduler:
+    def __init__(self, gpio, pins, clock=None):
+        self.gpio = gpio
+        self.pins = tuple(pins)
+        self.clock = clock or RealClock()
+
+    # Emit a compiled waveform on the step offsets from constant_times() or
+    # plan_move(), with a single multi-pin GPIO.output(pins, state) write per
+    # step. The move is len(times) - 1 steps; a longer waveform (shared between
+    # moves) is only used up to there. Returns timing stats.
+    def run(self, waveform, times):
+        output = self.gpio.output
+        pins = self.pins
+        now = self.clock.now
+        wait_until = self.clock.wait_until
+        steps = len(times) - 1
+        lateness = [0.0] * steps
+        t0 = now()
+        for i in range(steps):
+            deadline = t0 + times[i]
+            wait_until(deadline)
+            lateness[i] = now() - deadline
+            output(pins, waveform[i])
+        # hold the last step until the planned end of the move
+        wait_until(t0 + times[steps])
+        return step_stats(lateness, now() - t0, times[steps])
+
+
+def step_stats(lateness, elapsed, planned):
+    steps = len(lateness)
+    return {
+        "steps": steps,
+        "elapsed": elapsed,
+        "planned": planned,
+        "target_rps": steps / planned / STEPS_PER_REV if planned > 0 else 0.0,
+        "actual_rps": steps / elapsed / STEPS_PER_REV if elapsed > 0 else 0.0,
+        "mean_late": sum(lateness) / steps if steps else 0.0,
+        "max_late": max(lateness) if steps else 0.0,
+    }